@@ -2,6 +2,7 @@
 配置文件 - 广告规则自动化处理系统 (多阶段优化版)
 """
 import os
+import re
 from datetime import datetime
 
 class Config:
@@ -11,12 +12,24 @@ class Config:
     
     # ===【第一阶段：下载配置】===
     MAX_WORKERS = 8
+    PARSE_WORKERS = 0             # 阶段2解析进程数（0或1为单进程，多核runner可设为CPU核数；超过CPU核数时按核数计）
     REQUEST_TIMEOUT = 15
+    DOWNLOAD_ENGINE = 'thread'    # 下载引擎: 'thread'(线程池) 或 'asyncio'(需要aiohttp)
+    ASYNC_TOTAL_CONNECTIONS = 32  # asyncio引擎：总连接数上限
+    ASYNC_PER_HOST_CONNECTIONS = 4  # asyncio引擎：单主机并发上限
     CACHE_ENABLED = True
     CACHE_DIR = os.path.join(os.path.dirname(__file__), '..', '.cache')
     CACHE_EXPIRE_HOURS = 72
+    CACHE_REVALIDATE = True       # 缓存过期后使用ETag/Last-Modified条件请求
+    HONOR_LIST_EXPIRES = True     # 按列表头部 "! Expires:" 声明设置单源缓存有效期
+    LIST_EXPIRES_MIN_HOURS = 1    # 单源有效期下限（小时）
+    LIST_EXPIRES_MAX_HOURS = 168  # 单源有效期上限（小时）
     
     # ===【第二阶段：解析配置】===
+    STREAMING_PIPELINE = False    # 流式模式：边下载边解析，不保留完整正文
+    STREAM_CHUNK_SIZE = 65536     # 流式读取块大小（字符）
+    PARSE_CHUNK_CHARS = 4000000   # 多进程解析时超大源的切块大小（字符）
+    PARSED_CACHE_ENABLED = True   # 缓存各源解析结果，正文未变化的源跳过解析（需启用CACHE_ENABLED）
     PARSE_MAX_LINE_LENGTH = 1000  # 最大行长度限制
     SKIP_COMMENT_LINES = True     # 跳过注释行
     MIN_DOMAIN_LENGTH = 3         # 最小域名长度
@@ -26,10 +39,15 @@ class Config:
     ENABLE_MULTI_STAGE_DEDUP = True  # 启用多阶段去重
     # 第一阶段：快速哈希去重
     HASH_DEDUP_ENABLED = True
+    HASH_DEDUP_MODE = 'exact'        # 'exact'(字符串精确去重) 或 'fingerprint'(64位指纹，需要numpy)
     # 第二阶段：域名级去重
     DOMAIN_DEDUP_ENABLED = True
     # 第三阶段：子域名优化
     SUBDOMAIN_OPTIMIZATION = True
+    # 外存去重：规则数超过阈值时分桶落盘、逐桶去重后归并，结果与内存去重一致
+    EXTERNAL_DEDUP_ENABLED = True
+    EXTERNAL_DEDUP_MIN_RULES = 5000000  # 启用外存去重的规则数阈值
+    DEDUP_MEMORY_BUDGET_MB = 1024       # 单桶处理的内存预算（决定分桶数量）
     
     # ===【第四阶段：优化配置】===
     # 1. 数量限制（大幅提高）
@@ -45,21 +63,46 @@ class Config:
     # 3. 性能优化
     BATCH_PROCESS_SIZE = 100000    # 批处理大小
     TIMEOUT_FORCE_STOP = 1800      # 30分钟超时保护
+    CHECKPOINT_ENABLED = True      # 每个阶段完成后写入检查点，超时后可用 --resume 续跑
+    CHECKPOINT_MAX_AGE_HOURS = 6   # 检查点有效期（小时），须远小于每日定时运行间隔，避免发布前一天的规则
+    SCHEDULER_ENABLED = True       # 按历史耗时预估，时间不足时跳过/缩减可选阶段而非中止
+    SCHEDULER_HISTORY_RUNS = 10    # 参与预估的最近运行报告数
+    SCHEDULER_SAFETY_FACTOR = 1.5  # 预估耗时的安全系数
     
     # ===【第五阶段：二次优化配置】===
     ENABLE_SECONDARY_OPTIMIZATION = True
     # 1. 移除过期/失效规则
     REMOVE_EXPIRED_DOMAINS = True
+    EXPIRED_DOMAIN_PATTERNS = [        # 过期/失效域名模式（不区分大小写，合并编译为一个表达式）
+        r'\d{8,}',                     # 包含8位以上数字（可能是日期）
+        r'20\d{2}[01]\d[0-3]\d',       # 日期格式
+        r'expired', r'old', r'dead', r'invalid',
+        r'test', r'example', r'dummy'
+    ]
     # 2. 合并相似规则
     MERGE_SIMILAR_RULES = True
     SIMILARITY_THRESHOLD = 0.8     # 相似度阈值（0-1）
+    USE_PUBLIC_SUFFIX_LIST = True  # 按公共后缀列表计算主域名（co.uk、github.io等不再被合并为一组）
+    PUBLIC_SUFFIX_FILE = os.path.join(os.path.dirname(__file__), 'public_suffix_list.dat')
     # 3. 规则排序优化
     SORT_BY_PRIORITY = True
     SORT_BY_LENGTH = True
     
     # ===【文件输出配置】===
     OUTPUT_DIR = "dist"
+    HOSTS_COMPACT = False          # 紧凑Hosts格式：统一为单一地址，每行写入多个域名，显著缩小 hosts.txt
+    HOSTS_SINK_ADDRESS = "0.0.0.0" # 紧凑格式使用的地址
+    HOSTS_DOMAINS_PER_LINE = 1     # 紧凑格式每行域名数（Windows hosts 每行最多9个）
+    DIST_COMPRESSION = ['gzip']    # 同时生成的预压缩副本：gzip（.gz）、brotli（.br，需 brotli）、zstd（.zst，需 zstandard）
+    DIST_MANIFEST_ENABLED = True   # 生成 dist/manifest.json（大小、SHA-256、规则数），客户端可据此跳过未变化的下载
+    DIFF_UPDATES_ENABLED = True    # 为每个输出文件生成相邻两代之间的差量补丁（dist/patches/，AdGuard/uBO Diff-Path 格式）
+    DIFF_PATCH_RETENTION_DAYS = 7  # 补丁保留天数，更早的客户端回退为完整下载
+    DIFF_PATCH_EXPIRATION_HOURS = 48  # 写入补丁文件名的有效期
     STATS_DIR = "stats"
+    STATS_REPORT_FILE = "report_latest.md"  # 最近一次运行的Markdown报告（位于 STATS_DIR，每次覆盖）
+    STATS_WRITE_RUN_JSON = False   # 运行统计追加到 stats/history.jsonl；为True时仍额外保存每次运行的JSON
+    HISTORY_RETENTION_DAYS = 365   # 运行历史保留天数
+    HISTORY_MAX_RUNS = 1000        # 运行历史最多保留条数
     BACKUP_DIR = "backups"
     CHECK_DIR = "checks"
     
@@ -101,6 +144,15 @@ class Config:
     ENABLE_PERFORMANCE_MONITORING = True
     LOG_MEMORY_USAGE = True
     LOG_PROCESSING_TIME = True
+    TRACEMALLOC_TOP_N = 0          # >0 时记录每个阶段内存分配最多的N处代码（tracemalloc开销较大，默认关闭）
+    ENABLE_TRACING = False         # 导出 Chrome trace-event 追踪文件 stats/trace_*.json（chrome://tracing / Perfetto）
+    PROFILE_TOP_N = 30             # --profile 汇总中每个阶段列出的热点函数数
+    PERF_GATE_HISTORY_RUNS = 10    # 性能回归检测（scripts/perf_gate.py）基线使用的最近成功运行数
+    PERF_GATE_MIN_RUNS = 3         # 历史运行少于该数时不做检测
+    PERF_GATE_TIME_THRESHOLD = 0.5 # 阶段耗时超过基线50%判为回归
+    PERF_GATE_RATE_THRESHOLD = 0.3 # 吞吐量（规则/秒）低于基线30%判为回归
+    PERF_GATE_RATIO_THRESHOLD = 0.05  # 去重率比基线下降超过5个百分点判为回归
+    PERF_GATE_MIN_SECONDS = 1.0    # 耗时增加不足该秒数（或阶段耗时过短）时视为噪声
     
     @staticmethod
     def get_user_agent():
@@ -110,26 +162,39 @@ class Config:
     def get_current_date():
         return datetime.now().strftime("%Y%m%d")
     
+    _priority_matchers = None
+    
+    @staticmethod
+    def get_priority_matchers():
+        """优先级关键词匹配器（首次使用时构建）
+        
+        每档关键词先去掉包含同档更短关键词的冗余项（如 ads 已被 ad 覆盖），
+        再编译为一个分支表达式，一次扫描即可判断该档是否命中。
+        """
+        if Config._priority_matchers is None:
+            matchers = []
+            for weight, keywords in ((3, Config.HIGH_PRIORITY_KEYWORDS),
+                                     (2, Config.MEDIUM_PRIORITY_KEYWORDS),
+                                     (1, Config.LOW_PRIORITY_KEYWORDS)):
+                minimal = []
+                for keyword in sorted(set(k.lower() for k in keywords), key=len):
+                    if not any(shorter in keyword for shorter in minimal):
+                        minimal.append(keyword)
+                if minimal:
+                    pattern = re.compile('|'.join(re.escape(k) for k in minimal))
+                    matchers.append((weight, pattern.search))
+            Config._priority_matchers = matchers
+        return Config._priority_matchers
+    
     @staticmethod
     def get_priority_score(rule: str) -> int:
         """计算规则优先级分数"""
         score = 0
         rule_lower = rule.lower()
         
-        for keyword in Config.HIGH_PRIORITY_KEYWORDS:
-            if keyword in rule_lower:
-                score += 3
-                break
-                
-        for keyword in Config.MEDIUM_PRIORITY_KEYWORDS:
-            if keyword in rule_lower:
-                score += 2
-                break
-                
-        for keyword in Config.LOW_PRIORITY_KEYWORDS:
-            if keyword in rule_lower:
-                score += 1
-                break
+        for weight, search in Config.get_priority_matchers():
+            if search(rule_lower):
+                score += weight
         
         # 基于规则类型加分
         if rule.startswith('||') and rule.endswith('^'):
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+处理流程基准测试 - 使用固定种子生成的合成规则语料，逐类/逐阶段计时
+
+不访问网络：语料包含 Adblock、Hosts、纯域名、元素隐藏规则，以及重复规则、
+子域名和过期域名，规模可选 100k / 1m / 10m，结果保存为JSON便于前后对比。
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+from datetime import datetime
+from typing import List, Dict, Any, Callable, Tuple
+
+# 添加项目根目录与脚本目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    from config.settings import Config
+    from smart_rule_processor import (
+        SmartRuleParser, RuleRecord, MultiStageDeduplicator, AdvancedRuleOptimizer,
+        SecondaryOptimizer, RuleOutputManager
+    )
+except ImportError as e:
+    print(f"❌ 导入失败: {e}")
+    sys.exit(1)
+
+SIZE_PRESETS = {'100k': 100_000, '1m': 1_000_000, '10m': 10_000_000}
+
+class SyntheticCorpus:
+    """合成规则语料生成器（同一种子与规模生成的语料完全相同）"""
+
+    SYLLABLES = ['ad', 'ads', 'track', 'stat', 'cdn', 'pix', 'click', 'metric', 'beacon', 'tag',
+                 'banner', 'pop', 'media', 'serv', 'log', 'count', 'sync', 'data', 'web', 'net',
+                 'go', 'link', 'view', 'cast', 'star', 'zen', 'nova', 'bit', 'lab', 'hub']
+    TLDS = [('com', 40), ('net', 10), ('org', 5), ('cn', 8), ('io', 4), ('co.uk', 3),
+            ('com.cn', 3), ('de', 3), ('ru', 3), ('info', 3), ('xyz', 3), ('top', 3),
+            ('jp', 2), ('fr', 2), ('github.io', 1), ('com.br', 2), ('in', 2), ('me', 1)]
+    SUBDOMAINS = ['www', 'ads', 'cdn', 'static', 'img', 'track', 'api', 'm', 'log', 'stats']
+    # 命中 Config.EXPIRED_DOMAIN_PATTERNS 的标签，模拟过期/测试域名
+    EXPIRED_LABELS = ['test', 'old', 'expired', 'example', 'dummy', '20240101']
+    ADBLOCK_OPTIONS = ['third-party', 'script', 'image', 'popup', 'xmlhttprequest', 'domain=example.com']
+    SELECTORS = ['.ad-banner', '#ad', '.sponsored', 'div[id^="ad-"]', '.advert', '.popup-ad']
+
+    # 规则类型分布（其余为注释/空行）
+    MIX = [('adblock', 0.34), ('hosts', 0.25), ('domain', 0.15), ('element', 0.08),
+           ('adblock_options', 0.07), ('exception', 0.03), ('path', 0.03)]
+
+    def __init__(self, seed: int = 42, duplicate_rate: float = 0.3, subdomain_rate: float = 0.25):
+        self.seed = seed
+        self.duplicate_rate = duplicate_rate
+        self.subdomain_rate = subdomain_rate
+
+    def generate(self, size: int) -> List[str]:
+        """生成 size 行规则文本"""
+        rng = random.Random(f"{self.seed}:{size}")
+        tlds, tld_weights = zip(*self.TLDS)
+        kinds, kind_weights = zip(*self.MIX)
+        kinds = list(kinds) + ['comment']
+        kind_weights = list(kind_weights) + [1 - sum(kind_weights)]
+
+        base_domains = []
+        emitted = []
+        lines = []
+        # 预先按权重批量抽取，减少逐行调用开销
+        kind_draws = rng.choices(kinds, kind_weights, k=size)
+
+        for kind in kind_draws:
+            if emitted and rng.random() < self.duplicate_rate:
+                lines.append(self._duplicate(rng, rng.choice(emitted)))
+                continue
+
+            if kind == 'comment':
+                lines.append(rng.choice(['', '! Title: synthetic list', '# comment',
+                                         f"! Version: {rng.randint(1, 99999)}"]))
+                continue
+
+            if base_domains and rng.random() < self.subdomain_rate:
+                domain = f"{rng.choice(self.SUBDOMAINS)}.{rng.choice(base_domains)}"
+            else:
+                domain = self._domain(rng, tlds, tld_weights)
+                base_domains.append(domain)
+
+            line = self._rule(rng, kind, domain)
+            lines.append(line)
+            emitted.append(line)
+
+        return lines
+
+    def _domain(self, rng: random.Random, tlds, tld_weights) -> str:
+        labels = ''.join(rng.choice(self.SYLLABLES) for _ in range(rng.randint(1, 3)))
+        if rng.random() < 0.03:
+            labels = f"{labels}-{rng.choice(self.EXPIRED_LABELS)}"
+        return f"{labels}{rng.randint(0, 999)}.{rng.choices(tlds, tld_weights)[0]}"
+
+    def _rule(self, rng: random.Random, kind: str, domain: str) -> str:
+        if kind == 'adblock':
+            return f"||{domain}^"
+        if kind == 'hosts':
+            return f"{rng.choice(['0.0.0.0', '127.0.0.1'])} {domain}"
+        if kind == 'domain':
+            return domain
+        if kind == 'element':
+            return f"{domain}##{rng.choice(self.SELECTORS)}"
+        if kind == 'adblock_options':
+            return f"||{domain}^${rng.choice(self.ADBLOCK_OPTIONS)}"
+        if kind == 'exception':
+            return f"@@||{domain}^"
+        return f"/{rng.choice(self.SYLLABLES)}/{rng.choice(self.SYLLABLES)}_*.js"
+
+    @staticmethod
+    def _duplicate(rng: random.Random, line: str) -> str:
+        """重复规则：多数原样重复，部分为同一域名的其他写法（模拟不同列表间的重叠）"""
+        roll = rng.random()
+        if roll < 0.7:
+            return line
+        if line.startswith('||') and line.endswith('^'):
+            domain = line[2:-1]
+            return f"0.0.0.0 {domain}" if roll < 0.85 else domain
+        return f"  {line}  "
+
+class PipelineBenchmark:
+    """按处理顺序逐个计时各类的各个阶段，上一阶段的输出作为下一阶段的输入"""
+
+    def __init__(self, repeat: int = 1):
+        self.repeat = repeat
+
+    def _measure(self, func: Callable, make_input: Callable[[], Any], rules_in: int) -> Tuple[Dict[str, Any], Any]:
+        """重复执行取最短耗时；被测函数的输出被静默"""
+        runs = []
+        result = None
+        for _ in range(self.repeat):
+            data = make_input()
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                wall_start, cpu_start = time.perf_counter(), time.process_time()
+                result = func(data)
+                wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+            runs.append((wall, cpu))
+
+        wall, cpu = min(runs)
+        entry = {
+            'seconds': round(wall, 4),
+            'cpu_seconds': round(cpu, 4),
+            'runs': [round(run[0], 4) for run in runs],
+            'rules_in': rules_in,
+            'rules_out': len(result) if isinstance(result, list) else None,
+            'rules_per_second': round(rules_in / wall) if wall > 0 else None
+        }
+        return entry, result
+
+    def run(self, lines: List[str]) -> Dict[str, Dict[str, Any]]:
+        """运行全部阶段，返回 {阶段名: 计时结果}"""
+        results = {}
+
+        def step(name: str, func: Callable, rules: Any, copy: bool = True):
+            make_input = (lambda: list(rules)) if copy else (lambda: rules)
+            entry, output = self._measure(func, make_input, len(rules))
+            results[name] = entry
+            rules_out = '-' if entry['rules_out'] is None else f"{entry['rules_out']:,}"
+            print(f"  {name:<48} {entry['seconds']:>9.3f}秒 {entry['rules_in']:>11,} → {rules_out:>11} 条")
+            return output
+
+        parser = SmartRuleParser()
+
+        def parse(lines):
+            rules = []
+            for line in lines:
+                parsed = parser.parse_line(line)
+                if parsed:
+                    rules.append(RuleRecord.from_text(parsed))
+            return rules
+
+        rules = step('SmartRuleParser.parse_line', parse, lines, copy=False)
+
+        deduplicator = MultiStageDeduplicator()
+        deduped = rules
+        if Config.HASH_DEDUP_ENABLED:
+            deduped = step('MultiStageDeduplicator._hash_deduplicate', deduplicator._hash_deduplicate, deduped)
+        if Config.DOMAIN_DEDUP_ENABLED:
+            deduped = step('MultiStageDeduplicator._domain_deduplicate', deduplicator._domain_deduplicate, deduped)
+        if Config.SUBDOMAIN_OPTIMIZATION:
+            deduped = step('MultiStageDeduplicator._subdomain_optimize', deduplicator._subdomain_optimize, deduped)
+        # 外存去重会清空输入列表，每次运行使用副本
+        step('MultiStageDeduplicator._external_deduplicate', deduplicator._external_deduplicate, rules)
+
+        optimizer = AdvancedRuleOptimizer()
+        optimized = deduped
+        if Config.MIN_RULE_PRIORITY > 0:
+            optimized = step('AdvancedRuleOptimizer._filter_by_priority', optimizer._filter_by_priority, optimized)
+        if Config.ENABLE_RULE_VALIDATION:
+            optimized = step('AdvancedRuleOptimizer._validate_rules', optimizer._validate_rules, optimized)
+        optimized = step('AdvancedRuleOptimizer._filter_by_quality', optimizer._filter_by_quality, optimized)
+        optimized = step('AdvancedRuleOptimizer._classify_and_limit', optimizer._classify_and_limit, optimized)
+
+        secondary = SecondaryOptimizer()
+        final = optimized
+        if Config.REMOVE_EXPIRED_DOMAINS:
+            final = step('SecondaryOptimizer._remove_expired_domains', secondary._remove_expired_domains, final)
+        if Config.MERGE_SIMILAR_RULES:
+            final = step('SecondaryOptimizer._merge_similar_rules', secondary._merge_similar_rules, final)
+
+        # 输出写入临时目录，不覆盖 dist/ 中的正式规则
+        with tempfile.TemporaryDirectory(prefix="benchmark_output_") as output_dir:
+            cwd = os.getcwd()
+            os.chdir(output_dir)
+            try:
+                step('RuleOutputManager.save_results', RuleOutputManager.save_results, final, copy=False)
+            finally:
+                os.chdir(cwd)
+
+        return results
+
+    @staticmethod
+    def summarize(results: Dict[str, Dict[str, Any]]) -> Dict[str, float]:
+        """按类汇总耗时（外存去重为替代路径，单独列出不计入去重类合计）"""
+        totals = {}
+        for name, entry in results.items():
+            key = name if name.endswith('_external_deduplicate') else name.split('.')[0]
+            totals[key] = round(totals.get(key, 0) + entry['seconds'], 4)
+        return totals
+
+def parse_sizes(text: str) -> List[Tuple[str, int]]:
+    """解析规模参数，如 "100k,1m" 或 "250000" """
+    sizes = []
+    for item in text.split(','):
+        item = item.strip().lower()
+        if not item:
+            continue
+        if item in SIZE_PRESETS:
+            sizes.append((item, SIZE_PRESETS[item]))
+        else:
+            sizes.append((item, int(item)))
+    return sizes
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="广告规则处理流程基准测试（合成语料，无需网络）")
+    parser.add_argument('--sizes', default='100k,1m',
+                        help='语料规模，逗号分隔：100k、1m、10m 或具体行数（默认 100k,1m）')
+    parser.add_argument('--seed', type=int, default=42, help='语料生成种子（默认 42）')
+    parser.add_argument('--repeat', type=int, default=1, help='每个阶段重复次数，取最短耗时（默认 1）')
+    parser.add_argument('--output', help='结果JSON路径（默认 stats/benchmark_<时间>.json）')
+    args = parser.parse_args()
+
+    corpus = SyntheticCorpus(seed=args.seed)
+    benchmark = PipelineBenchmark(repeat=max(1, args.repeat))
+    # 外存去重的分桶目录位于缓存目录下，基准测试使用临时目录
+    cache_dir = tempfile.mkdtemp(prefix="benchmark_cache_")
+    Config.CACHE_DIR = cache_dir
+
+    report = {
+        'metadata': {
+            'time': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'repeat': benchmark.repeat,
+            'duplicate_rate': corpus.duplicate_rate,
+            'subdomain_rate': corpus.subdomain_rate
+        },
+        'results': {}
+    }
+
+    try:
+        for label, size in parse_sizes(args.sizes):
+            print(f"\n{'='*60}")
+            print(f"📊 语料规模: {label} ({size:,} 行, 种子 {args.seed})")
+            print(f"{'='*60}")
+
+            start_time = time.perf_counter()
+            lines = corpus.generate(size)
+            generate_time = time.perf_counter() - start_time
+            print(f"  语料生成: {generate_time:.2f}秒")
+
+            results = benchmark.run(lines)
+            report['results'][label] = {
+                'corpus': {
+                    'lines': size,
+                    'bytes': sum(map(len, lines)) + len(lines),
+                    'generate_seconds': round(generate_time, 2)
+                },
+                'benchmarks': results,
+                'class_totals': benchmark.summarize(results)
+            }
+            del lines
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    output = args.output or os.path.join(
+        Config.STATS_DIR, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print(f"\n✅ 基准测试完成，结果: {output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+性能回归检测 - 读取运行历史（stats/history.jsonl），与最近N次运行的基线比较
+
+检测各阶段耗时、吞吐量（规则/秒）与去重率，超出阈值时以非零状态退出；
+也可作为库使用：PerfGate().check() 返回比较结果。
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+
+# 添加项目根目录与脚本目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    from config.settings import Config
+    from smart_rule_processor import RunHistory
+except ImportError as e:
+    print(f"❌ 导入失败: {e}")
+    sys.exit(1)
+
+# 参与检测的阶段（阶段1受网络波动影响，不作为回归依据）
+GATED_STAGES = ('stage2_parse', 'stage3_dedup', 'stage4_optimize', 'stage5_secondary', 'stage6_output')
+
+def load_run(path: Path) -> Optional[Dict[str, Any]]:
+    """读取单次运行JSON（STATS_WRITE_RUN_JSON 或外部文件），无法解析时返回None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def extract_metrics(data: Dict[str, Any]) -> Dict[str, float]:
+    """从运行报告中提取可比较的指标
+
+    - <阶段>.time：阶段耗时（秒）
+    - <阶段>.rules_per_second：按阶段输入规则数计算的吞吐量
+    - stage3_dedup.removed_ratio：去重移除比例
+    - gated_time：参与检测各阶段的耗时之和（不含受网络影响的阶段1，取代总耗时）
+    被时间预算调度器降级或跳过的阶段不产生指标。
+    """
+    stages = data.get('stage_statistics', {})
+    degraded = {item.get('stage') for item in data.get('scheduler', {}).get('degradations', [])}
+
+    metrics = {}
+    for name in GATED_STAGES:
+        stage = stages.get(name)
+        if not isinstance(stage, dict) or name in degraded or stage.get('skipped'):
+            continue
+        elapsed = stage.get('time')
+        if not elapsed:
+            continue
+        metrics[f"{name}.time"] = elapsed
+        count = stage.get('before', stage.get('rules'))
+        if count:
+            metrics[f"{name}.rules_per_second"] = count / elapsed
+
+    stage_times = [metrics[f"{name}.time"] for name in GATED_STAGES if f"{name}.time" in metrics]
+    if stage_times:
+        metrics['gated_time'] = sum(stage_times)
+
+    dedup = stages.get('stage3_dedup', {})
+    if dedup.get('before') and 'stage3_dedup' not in degraded:
+        metrics['stage3_dedup.removed_ratio'] = 1 - dedup.get('after', 0) / dedup['before']
+    return metrics
+
+def is_profiled(data: Dict[str, Any]) -> bool:
+    """是否为 --profile 运行（cProfile 开销会放大阶段耗时，不参与基线与检测）"""
+    return bool(data.get('profile_files'))
+
+class PerfGate:
+    """性能回归检测：以最近N次成功运行各指标的中位数为基线"""
+
+    def __init__(self, stats_dir: str = Config.STATS_DIR,
+                 history_runs: int = Config.PERF_GATE_HISTORY_RUNS,
+                 time_threshold: float = Config.PERF_GATE_TIME_THRESHOLD,
+                 rate_threshold: float = Config.PERF_GATE_RATE_THRESHOLD,
+                 ratio_threshold: float = Config.PERF_GATE_RATIO_THRESHOLD,
+                 min_seconds: float = Config.PERF_GATE_MIN_SECONDS,
+                 min_runs: int = Config.PERF_GATE_MIN_RUNS):
+        self.history = RunHistory(stats_dir)
+        self.history_runs = history_runs
+        self.time_threshold = time_threshold
+        self.rate_threshold = rate_threshold
+        self.ratio_threshold = ratio_threshold
+        self.min_seconds = min_seconds
+        self.min_runs = min_runs
+
+    def load_history(self, exclude: Optional[str] = None) -> List[Dict[str, float]]:
+        """最近N次成功运行的指标（排除待检测的运行本身与 --profile 运行）"""
+        runs = [row for row in self.history.runs(status='success')
+                if row.get('run_id') != exclude and not is_profiled(row)]
+        return [extract_metrics(row) for row in runs[-self.history_runs:]]
+
+    @staticmethod
+    def baseline(history: List[Dict[str, float]]) -> Dict[str, Tuple[float, int]]:
+        """各指标的中位数基线及样本数"""
+        samples = {}
+        for metrics in history:
+            for key, value in metrics.items():
+                samples.setdefault(key, []).append(value)
+        return {key: (statistics.median(values), len(values)) for key, values in samples.items()}
+
+    def compare(self, current: Dict[str, float], baseline: Dict[str, Tuple[float, int]]) -> List[Dict[str, Any]]:
+        """逐项比较，返回每个指标的比较结果
+
+        - 耗时：超过基线 (1 + time_threshold) 倍且增加至少 min_seconds 秒
+        - 吞吐量：低于基线 (1 - rate_threshold) 倍（阶段耗时低于 min_seconds 时不判定，避免噪声）
+        - 去重率：比基线下降超过 ratio_threshold（绝对值）
+        """
+        results = []
+        for key, value in current.items():
+            if key not in baseline:
+                continue
+            base, samples = baseline[key]
+            if samples < self.min_runs:
+                continue
+
+            stage = key.split('.')[0]
+            stage_time = current.get(f"{stage}.time", 0)
+            if key.endswith('removed_ratio'):
+                threshold = self.ratio_threshold
+                regression = value < base - threshold
+                change = value - base
+            elif key.endswith('rules_per_second'):
+                threshold = self.rate_threshold
+                regression = value < base * (1 - threshold) and stage_time >= self.min_seconds
+                change = value / base - 1 if base else 0.0
+            else:
+                threshold = self.time_threshold
+                regression = value > base * (1 + threshold) and value - base >= self.min_seconds
+                change = value / base - 1 if base else 0.0
+
+            results.append({
+                'metric': key,
+                'baseline': round(base, 4),
+                'current': round(value, 4),
+                'change': round(change, 4),
+                'threshold': threshold,
+                'samples': samples,
+                'regression': regression
+            })
+        return results
+
+    def check(self, current: Optional[str] = None) -> Dict[str, Any]:
+        """检测指定运行相对历史基线的回归
+
+        current 可以是运行ID（如 20260104_034611）或单次运行JSON文件路径，默认为运行历史中最新一次。
+        """
+        if current and current.endswith('.json'):
+            data = load_run(Path(current))
+            run_id = data.get('run_id') if data else None
+        else:
+            data = self.history.get(current) if current else next(iter(self.history.runs(last=1)), None)
+            run_id = data.get('run_id') if data else current
+        if not data:
+            return {'status': 'no_data', 'current': current, 'results': []}
+        label = current if current and current.endswith('.json') else run_id
+        if is_profiled(data):
+            return {'status': 'profiled', 'current': label, 'results': []}
+
+        history = self.load_history(exclude=run_id)
+        if len(history) < self.min_runs:
+            return {'status': 'insufficient_history', 'current': label,
+                    'history_runs': len(history), 'results': []}
+
+        results = self.compare(extract_metrics(data), self.baseline(history))
+        regressions = [item for item in results if item['regression']]
+        return {
+            'status': 'regression' if regressions else 'ok',
+            'current': label,
+            'history_runs': len(history),
+            'regressions': len(regressions),
+            'results': results
+        }
+
+def format_change(item: Dict[str, Any]) -> str:
+    if item['metric'].endswith('removed_ratio'):
+        return f"{item['change'] * 100:+.1f}pp"
+    return f"{item['change']:+.1%}"
+
+def main():
+    """主函数：存在回归时返回1"""
+    parser = argparse.ArgumentParser(description="性能回归检测（对比运行历史中最近N次运行的基线）")
+    parser.add_argument('--current', help='待检测的运行ID或单次运行JSON文件（默认运行历史中最新一次）')
+    parser.add_argument('--stats-dir', default=Config.STATS_DIR, help='运行历史所在目录')
+    parser.add_argument('--history', type=int, default=Config.PERF_GATE_HISTORY_RUNS, help='基线使用的历史运行数')
+    parser.add_argument('--time-threshold', type=float, default=Config.PERF_GATE_TIME_THRESHOLD,
+                        help='阶段耗时增加比例阈值（0.5 = 慢50%%）')
+    parser.add_argument('--rate-threshold', type=float, default=Config.PERF_GATE_RATE_THRESHOLD,
+                        help='吞吐量下降比例阈值')
+    parser.add_argument('--ratio-threshold', type=float, default=Config.PERF_GATE_RATIO_THRESHOLD,
+                        help='去重率下降阈值（绝对值）')
+    parser.add_argument('--json', help='将检测结果写入JSON文件')
+    args = parser.parse_args()
+
+    gate = PerfGate(stats_dir=args.stats_dir, history_runs=args.history,
+                    time_threshold=args.time_threshold, rate_threshold=args.rate_threshold,
+                    ratio_threshold=args.ratio_threshold)
+    report = gate.check(args.current)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print("=" * 60)
+    print("📉 性能回归检测")
+    print("=" * 60)
+
+    if report['status'] == 'no_data':
+        print("⚠️  未找到可检测的运行记录")
+        return 0
+    print(f"📄 检测运行: {report['current']}")
+    if report['status'] == 'profiled':
+        print("⚠️  该运行启用了 --profile，阶段耗时含剖析开销，跳过检测")
+        return 0
+    if report['status'] == 'insufficient_history':
+        print(f"⚠️  历史运行不足（{report['history_runs']} 次，至少需要 {gate.min_runs} 次），跳过检测")
+        return 0
+
+    print(f"📊 基线: 最近 {report['history_runs']} 次成功运行的中位数\n")
+    for item in report['results']:
+        mark = '❌' if item['regression'] else '✅'
+        print(f"  {mark} {item['metric']:<36} 基线 {item['baseline']:>14,.3f}  "
+              f"本次 {item['current']:>14,.3f}  ({format_change(item)})")
+
+    if report['status'] == 'regression':
+        print(f"\n❌ 检测到 {report['regressions']} 项性能回归")
+        return 1
+    print(f"\n✅ 未检测到性能回归")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,13 +10,36 @@ import re
 import time
 import json
 import signal
+import argparse
+import shutil
+import asyncio
+import pickle
 import hashlib
+import zlib
+import difflib
+import heapq
+import tempfile
+import statistics
+import threading
+import functools
+import tracemalloc
+import cProfile
+import pstats
+from array import array
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List, Set, Optional, Tuple, Any
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Set, Optional, Tuple, Any, Callable, Collection
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from collections import defaultdict
+from itertools import compress, repeat
+from operator import attrgetter
 from pathlib import Path
 
+try:
+    import resource  # 仅Unix可用，用于读取CPU时间与峰值内存
+except ImportError:
+    resource = None
+
 # 添加项目根目录到Python路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -31,6 +54,7 @@ DOMAIN_PATTERN = re.compile(r'^([a-zA-Z0-9]([a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?\.)+
 HOSTS_PATTERN = re.compile(r'^(0\.0\.0\.0|127\.0\.0\.1)\s+(\S+)')
 ADBLOCK_DOMAIN_PATTERN = re.compile(r'^\|\|([a-zA-Z0-9.*-]+)\^')
 ADBLOCK_ELEMENT_PATTERN = re.compile(r'^([^#]+)##(.+)$')
+EXPIRES_PATTERN = re.compile(r'^[!#]\s*Expires\s*:\s*(\d+)\s*(days?|hours?|d|h)?', re.IGNORECASE | re.MULTILINE)
 
 # 超时控制
 class TimeoutException(Exception):
@@ -52,6 +76,191 @@ def get_shanghai_time() -> datetime:
 def get_time_string() -> str:
     return get_shanghai_time().strftime('%Y-%m-%d %H:%M:%S')
 
+def measure_peak_memory(func: Callable, *args) -> Tuple[Any, Optional[float]]:
+    """执行函数并返回 (结果, 执行期间新增内存峰值MB)，未启用内存记录时峰值为None"""
+    if not Config.LOG_MEMORY_USAGE:
+        return func(*args), None
+    
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    else:
+        tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    try:
+        result = func(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        if started:
+            tracemalloc.stop()
+    return result, round((peak - baseline) / (1024 * 1024), 2)
+
+def content_sha256(content: str) -> str:
+    """规则源正文哈希（UTF-8编码后的SHA-256），用于识别未变化的源"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+def format_size(size: Optional[int]) -> str:
+    """字节数格式化为 KB/MB"""
+    if size is None:
+        return '-'
+    if size >= 1024 * 1024:
+        return f"{size / (1024 * 1024):.1f}MB"
+    return f"{size / 1024:.1f}KB"
+
+def _read_proc_memory() -> Dict[str, float]:
+    """读取 /proc/self/status 中的当前与峰值RSS（MB），非Linux返回空字典"""
+    fields = {'VmRSS': 'rss_mb', 'VmHWM': 'peak_rss_mb'}
+    memory = {}
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if name in fields:
+                    memory[fields[name]] = round(int(value.split()[0]) / 1024, 1)
+    except (OSError, ValueError, IndexError):
+        pass
+    return memory
+
+def _reset_peak_rss() -> bool:
+    """重置进程峰值RSS（Linux: 向 /proc/self/clear_refs 写入5），成功后峰值仅反映当前阶段"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def _children_cpu_time() -> float:
+    """已结束子进程（多进程解析）的累计CPU时间"""
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def _process_peak_rss_mb() -> Optional[float]:
+    """进程生命周期内的峰值RSS（无法按阶段重置时的回退）"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux单位为KB，macOS为字节
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+def _feed_lines(chunks, on_lines: Callable[[List[str]], None]) -> int:
+    """把文本块切分为行（与 str.split('\\n') 一致）并逐批回调，返回行数"""
+    pending = ''
+    count = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        lines = (pending + chunk).split('\n')
+        pending = lines.pop()
+        if lines:
+            count += len(lines)
+            on_lines(lines)
+    on_lines([pending])
+    return count + 1
+
+class RunTracer:
+    """轻量级运行追踪器，导出 Chrome trace-event JSON（chrome://tracing / Perfetto 可直接打开）
+    
+    每个 span 记录为完整事件（"ph": "X"），按线程分轨道，并发下载在线程池中各占一条轨道；
+    asyncio 下载共用一个线程，通过 track 指定虚拟轨道。未启用时 span 为空操作。
+    """
+    
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.tracks = {}
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+    
+    def start(self):
+        """开始记录（清空之前的事件）"""
+        self.enabled = True
+        self.events = []
+        self.tracks = {'main': 1}
+        self._origin = time.perf_counter()
+    
+    def _track_id(self, track: Optional[str]) -> int:
+        if track is None:
+            thread = threading.current_thread()
+            track = 'main' if thread is threading.main_thread() else thread.name
+        with self._lock:
+            return self.tracks.setdefault(track, len(self.tracks) + 1)
+    
+    def complete(self, name: str, category: str, start: float, track: Optional[str] = None, **args):
+        """记录从 start（time.perf_counter）到当前的完整事件"""
+        if not self.enabled:
+            return
+        end = time.perf_counter()
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': round((start - self._origin) * 1e6, 1),
+            'dur': round((end - start) * 1e6, 1),
+            'pid': os.getpid(),
+            'tid': self._track_id(track)
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            self.events.append(event)
+    
+    @contextmanager
+    def span(self, name: str, category: str, track: Optional[str] = None, **args):
+        """记录代码块耗时"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.complete(name, category, start, track, **args)
+    
+    def save(self, path: str) -> int:
+        """写入 trace-event JSON，返回事件数"""
+        pid = os.getpid()
+        metadata = [{'name': 'process_name', 'ph': 'M', 'pid': pid,
+                     'args': {'name': 'smart_rule_processor'}}]
+        for track, tid in self.tracks.items():
+            metadata.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                             'args': {'name': track}})
+            metadata.append({'name': 'thread_sort_index', 'ph': 'M', 'pid': pid, 'tid': tid,
+                             'args': {'sort_index': tid}})
+        with self._lock:
+            events = sorted(self.events, key=lambda event: event['ts'])
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+        return len(events)
+
+TRACER = RunTracer()
+
+def traced(category: str, describe: Optional[Callable[..., Dict[str, Any]]] = None):
+    """方法追踪装饰器：span 名为方法的限定名，参数默认记录首个列表参数的规则数"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not TRACER.enabled:
+                return func(*args, **kwargs)
+            if describe is not None:
+                info = describe(*args, **kwargs)
+            else:
+                rules = next((arg for arg in args if isinstance(arg, list)), None)
+                info = {} if rules is None else {'rules_in': len(rules)}
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            if isinstance(result, list):
+                info['rules_out'] = len(result)
+            TRACER.complete(func.__qualname__, category, start, **info)
+            return result
+        return wrapper
+    return decorator
+
+def _describe_url(fetcher, url: str, *args, **kwargs) -> Dict[str, Any]:
+    return {'url': url}
+
 class AdvancedRuleFetcher:
     """高级规则获取器"""
     
@@ -73,7 +282,11 @@ class AdvancedRuleFetcher:
         
         self.stats = {
             'total': 0, 'success': 0, 'cached': 0,
-            'failed': 0, 'timeout': 0
+            'failed': 0, 'timeout': 0,
+            'cache_hit': 0, 'cache_miss': 0, 'not_modified': 0,
+            'fresh_by_expires': 0,
+            # 流式下载中途断开的规则源（同时计入 failed/timeout），已解析的部分规则被丢弃
+            'partial': 0, 'partial_sources': []
         }
     
     def _create_session(self):
@@ -106,23 +319,186 @@ class AdvancedRuleFetcher:
         url_hash = hashlib.md5(url.encode()).hexdigest()
         return self.cache_dir / f"cache_{url_hash}.txt"
     
+    def _get_meta_path(self, url: str) -> Path:
+        """生成缓存元数据路径（ETag / Last-Modified）"""
+        return self._get_cache_path(url).with_suffix('.meta.json')
+    
+    def _load_cache_meta(self, url: str) -> Dict[str, Any]:
+        """读取缓存元数据，不存在或损坏时返回空字典"""
+        try:
+            with open(self._get_meta_path(url), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            return meta if isinstance(meta, dict) else {}
+        except:
+            return {}
+    
+    @staticmethod
+    def _parse_expires(content: str) -> Optional[int]:
+        """解析列表头部的 "! Expires: 4 days" 声明，返回秒数"""
+        match = EXPIRES_PATTERN.search(content[:8192])
+        if not match:
+            return None
+        
+        value = int(match.group(1))
+        unit = (match.group(2) or 'days').lower()
+        seconds = value * 3600 if unit.startswith('h') else value * 86400
+        
+        # 限制在合理范围内，避免异常声明导致永不更新或频繁下载
+        min_seconds = Config.LIST_EXPIRES_MIN_HOURS * 3600
+        max_seconds = Config.LIST_EXPIRES_MAX_HOURS * 3600
+        return max(min_seconds, min(seconds, max_seconds))
+    
+    def _cache_ttl(self, url: str) -> Tuple[int, bool]:
+        """获取源的缓存有效期（秒），以及是否来自列表自身的Expires声明"""
+        if Config.HONOR_LIST_EXPIRES:
+            expires = self._load_cache_meta(url).get('expires_seconds')
+            if isinstance(expires, int) and expires > 0:
+                return expires, True
+        return Config.CACHE_EXPIRE_HOURS * 3600, False
+    
+    def _read_cache(self, cache_file: Path) -> Optional[str]:
+        """读取缓存内容"""
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                return f.read()
+        except:
+            return None
+    
+    def _iter_cache_chunks(self, cache_file: Path):
+        """分块读取缓存内容"""
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            while True:
+                chunk = f.read(Config.STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    
+    def _save_cache(self, url: str, content: str, headers) -> None:
+        """保存缓存内容及验证器"""
+        try:
+            with open(self._get_cache_path(url), 'w', encoding='utf-8') as f:
+                f.write(content)
+            self._save_cache_meta(url, content[:8192], headers, content_sha256(content))
+        except:
+            pass
+    
+    def _save_cache_meta(self, url: str, head: str, headers, sha256: Optional[str] = None) -> None:
+        """保存缓存元数据（验证器、正文哈希与列表声明的有效期）"""
+        meta = {'url': url, 'fetched_at': time.time()}
+        if sha256:
+            meta['sha256'] = sha256
+        if headers.get('ETag'):
+            meta['etag'] = headers['ETag']
+        if headers.get('Last-Modified'):
+            meta['last_modified'] = headers['Last-Modified']
+        expires = self._parse_expires(head)
+        if expires:
+            meta['expires_seconds'] = expires
+        with open(self._get_meta_path(url), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+    
+    def cached_content_hash(self, url: str) -> Optional[str]:
+        """缓存正文的SHA-256（旧版本缓存没有记录时返回None）"""
+        return self._load_cache_meta(url).get('sha256')
+    
+    def _feed_cache(self, url: str, cache_file: Path, on_lines: Callable[[List[str]], None],
+                    reuse: Optional[Callable[[str], Optional[int]]] = None) -> int:
+        """从缓存读取正文并逐批回调行，返回行数
+        
+        reuse 接收正文哈希，调用方已有该正文的解析结果时返回其行数，
+        此时不再读取缓存正文。元数据缺少哈希时在读取过程中补算并写回。
+        """
+        meta = self._load_cache_meta(url)
+        sha256 = meta.get('sha256')
+        if reuse and sha256:
+            lines = reuse(sha256)
+            if lines is not None:
+                return lines
+        
+        hasher = hashlib.sha256()
+        
+        def hashed(chunks):
+            for chunk in chunks:
+                hasher.update(chunk.encode('utf-8'))
+                yield chunk
+        
+        lines = _feed_lines(hashed(self._iter_cache_chunks(cache_file)), on_lines)
+        
+        if not sha256 and meta:
+            meta['sha256'] = hasher.hexdigest()
+            try:
+                with open(self._get_meta_path(url), 'w', encoding='utf-8') as f:
+                    json.dump(meta, f, ensure_ascii=False)
+            except OSError:
+                pass
+        return lines
+    
+    def _conditional_headers(self, url: str, cache_file: Path) -> Dict[str, str]:
+        """根据缓存元数据生成条件请求头"""
+        if not (Config.CACHE_ENABLED and Config.CACHE_REVALIDATE and cache_file.exists()):
+            return {}
+        
+        meta = self._load_cache_meta(url)
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+    
+    def _check_fresh_cache(self, url: str, cache_file: Path) -> Tuple[bool, bool]:
+        """检查缓存是否在有效期内（有效期优先使用列表声明的Expires）"""
+        if not (Config.CACHE_ENABLED and cache_file.exists()):
+            return False, False
+        
+        cache_age = time.time() - cache_file.stat().st_mtime
+        ttl, from_expires = self._cache_ttl(url)
+        return cache_age < ttl, from_expires
+    
+    def _count_cache_hit(self, from_expires: bool):
+        self.stats['cached'] += 1
+        self.stats['cache_hit'] += 1
+        self.stats['success'] += 1
+        if from_expires:
+            self.stats['fresh_by_expires'] += 1
+    
+    def _count_not_modified(self, cache_file: Path):
+        """304：源未变化，刷新缓存有效期并计数"""
+        try:
+            os.utime(cache_file, None)
+        except:
+            pass
+        self.stats['not_modified'] += 1
+        self.stats['cached'] += 1
+        self.stats['success'] += 1
+    
+    def _load_fresh_cache(self, url: str, cache_file: Path) -> Optional[str]:
+        """缓存仍在有效期内时返回内容"""
+        fresh, from_expires = self._check_fresh_cache(url, cache_file)
+        if not fresh:
+            return None
+        
+        content = self._read_cache(cache_file)
+        if content is not None:
+            self._count_cache_hit(from_expires)
+        return content
+    
+    def _load_not_modified(self, cache_file: Path) -> Optional[str]:
+        """304：源未变化，沿用缓存"""
+        content = self._read_cache(cache_file)
+        if content is not None:
+            self._count_not_modified(cache_file)
+        return content
+    
+    @traced('fetch', _describe_url)
     def fetch_url(self, url: str) -> Tuple[bool, Optional[str], int]:
-        """获取URL内容（带智能缓存）"""
+        """获取URL内容（带智能缓存与条件请求）"""
         cache_file = self._get_cache_path(url)
         
         # 检查缓存
-        if Config.CACHE_ENABLED and cache_file.exists():
-            cache_age = time.time() - cache_file.stat().st_mtime
-            if cache_age < Config.CACHE_EXPIRE_HOURS * 3600:
-                try:
-                    with open(cache_file, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        lines = content.count('\n')
-                        self.stats['cached'] += 1
-                        self.stats['success'] += 1
-                        return True, content, lines
-                except:
-                    pass  # 缓存读取失败，重新下载
+        content = self._load_fresh_cache(url, cache_file)
+        if content is not None:
+            return True, content, content.count('\n')
         
         # 网络请求
         try:
@@ -130,8 +506,17 @@ class AdvancedRuleFetcher:
             response = self.session.get(
                 url, 
                 timeout=Config.REQUEST_TIMEOUT,
+                headers=self._conditional_headers(url, cache_file),
                 stream=False
             )
+            
+            if response.status_code == 304:
+                content = self._load_not_modified(cache_file)
+                if content is not None:
+                    return True, content, content.count('\n')
+                # 缓存已丢失，无条件重新请求
+                response = self.session.get(url, timeout=Config.REQUEST_TIMEOUT)
+            
             response.raise_for_status()
             
             content = response.text
@@ -140,12 +525,9 @@ class AdvancedRuleFetcher:
             
             # 保存缓存
             if Config.CACHE_ENABLED:
-                try:
-                    with open(cache_file, 'w', encoding='utf-8') as f:
-                        f.write(content)
-                except:
-                    pass
+                self._save_cache(url, content, response.headers)
             
+            self.stats['cache_miss'] += 1
             self.stats['success'] += 1
             return True, content, lines
             
@@ -155,14 +537,349 @@ class AdvancedRuleFetcher:
         except Exception as e:
             self.stats['failed'] += 1
             return False, None, 0
+    
+    @traced('fetch', _describe_url)
+    def fetch_url_lines(self, url: str, on_lines: Callable[[List[str]], None],
+                        reuse: Optional[Callable[[str], Optional[int]]] = None) -> Tuple[bool, int]:
+        """流式获取URL内容：按块读取并逐批回调行，不在内存中保留完整正文
+        
+        源未变化（缓存有效或304）且 reuse 表示已有解析结果时不再回调行，见 _feed_cache。
+        """
+        cache_file = self._get_cache_path(url)
+        
+        # 检查缓存
+        fresh, from_expires = self._check_fresh_cache(url, cache_file)
+        if fresh:
+            try:
+                lines = self._feed_cache(url, cache_file, on_lines, reuse)
+                self._count_cache_hit(from_expires)
+                return True, lines
+            except OSError:
+                pass  # 缓存读取失败，重新下载
+        
+        # 网络请求
+        try:
+            response = self.session.get(
+                url,
+                timeout=Config.REQUEST_TIMEOUT,
+                headers=self._conditional_headers(url, cache_file),
+                stream=True
+            )
+            
+            if response.status_code == 304:
+                response.close()
+                try:
+                    lines = self._feed_cache(url, cache_file, on_lines, reuse)
+                    self._count_not_modified(cache_file)
+                    return True, lines
+                except OSError:
+                    # 缓存已丢失，无条件重新请求
+                    response = self.session.get(url, timeout=Config.REQUEST_TIMEOUT, stream=True)
+            
+            with response:
+                response.raise_for_status()
+                if response.encoding is None:
+                    response.encoding = 'utf-8'
+                
+                chunks = self._track_partial(url, response.iter_content(
+                    chunk_size=Config.STREAM_CHUNK_SIZE, decode_unicode=True))
+                if Config.CACHE_ENABLED:
+                    lines = self._stream_to_cache(url, chunks, on_lines, response.headers)
+                else:
+                    lines = _feed_lines(chunks, on_lines)
+            
+            self.stats['cache_miss'] += 1
+            self.stats['success'] += 1
+            return True, lines
+            
+        except self.requests.exceptions.Timeout:
+            self.stats['timeout'] += 1
+            return False, 0
+        except Exception as e:
+            self.stats['failed'] += 1
+            return False, 0
+    
+    def _track_partial(self, url: str, chunks):
+        """下载中途断开时记录为部分下载的规则源（其已解析的规则由调用方丢弃）"""
+        received = False
+        try:
+            for chunk in chunks:
+                received = True
+                yield chunk
+        except Exception:
+            if received:
+                self.stats['partial'] += 1
+                self.stats['partial_sources'].append(url)
+            raise
+    
+    def _stream_to_cache(self, url: str, chunks, on_lines, headers) -> int:
+        """边解析边写入缓存，完成后原子替换旧缓存"""
+        cache_file = self._get_cache_path(url)
+        tmp_file = cache_file.with_suffix('.tmp')
+        head = []
+        head_size = 0
+        hasher = hashlib.sha256()
+        
+        def tee(chunks):
+            nonlocal head_size
+            for chunk in chunks:
+                if head_size < 8192:
+                    head.append(chunk)
+                    head_size += len(chunk)
+                hasher.update(chunk.encode('utf-8'))
+                f.write(chunk)
+                yield chunk
+        
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                lines = _feed_lines(tee(chunks), on_lines)
+        except BaseException:
+            # 下载中断：删除不完整的临时文件，保留旧缓存
+            tmp_file.unlink(missing_ok=True)
+            raise
+        
+        try:
+            os.replace(tmp_file, cache_file)
+            self._save_cache_meta(url, ''.join(head)[:8192], headers, hasher.hexdigest())
+        except:
+            pass
+        return lines
+    
+    @staticmethod
+    def async_available() -> bool:
+        """检查异步下载引擎依赖（aiohttp）是否可用"""
+        try:
+            import aiohttp
+            return True
+        except ImportError:
+            return False
+    
+    def fetch_all_async(self, urls: List[str],
+                        on_done: Optional[Callable[[str, Tuple[bool, Optional[str], int]], None]] = None
+                        ) -> Dict[str, Tuple[bool, Optional[str], int]]:
+        """使用asyncio并发获取所有URL（缓存语义与统计同fetch_url）"""
+        return asyncio.run(self._fetch_all_async(urls, on_done))
+    
+    async def _fetch_all_async(self, urls, on_done):
+        import aiohttp
+        
+        connector = aiohttp.TCPConnector(
+            limit=Config.ASYNC_TOTAL_CONNECTIONS,
+            limit_per_host=Config.ASYNC_PER_HOST_CONNECTIONS
+        )
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=Config.REQUEST_TIMEOUT,
+            sock_read=Config.REQUEST_TIMEOUT
+        )
+        headers = {
+            'User-Agent': Config.get_user_agent(),
+            'Accept': 'text/plain, */*'
+        }
+        
+        results = {}
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         headers=headers) as session:
+            async def run(index, url):
+                # 协程共用事件循环线程，每个URL使用独立的虚拟轨道
+                with TRACER.span('AdvancedRuleFetcher._fetch_url_async', 'fetch',
+                                 track=f"async-{index}", url=url):
+                    result = await self._fetch_url_async(session, url)
+                results[url] = result
+                if on_done:
+                    on_done(url, result)
+            
+            await asyncio.gather(*(run(index, url) for index, url in enumerate(urls)))
+        
+        return results
+    
+    async def _fetch_url_async(self, session, url: str) -> Tuple[bool, Optional[str], int]:
+        """异步获取单个URL（重试策略与同步会话一致）"""
+        import aiohttp
+        
+        cache_file = self._get_cache_path(url)
+        content = self._load_fresh_cache(url, cache_file)
+        if content is not None:
+            return True, content, content.count('\n')
+        
+        headers = self._conditional_headers(url, cache_file)
+        retry_status = {429, 500, 502, 503, 504}
+        
+        for attempt in range(3):
+            if attempt > 1:
+                await asyncio.sleep(2 ** (attempt - 1))
+            try:
+                async with session.get(url, headers=headers) as response:
+                    if response.status == 304:
+                        content = self._load_not_modified(cache_file)
+                        if content is not None:
+                            return True, content, content.count('\n')
+                        # 缓存已丢失，无条件重新请求
+                        headers = {}
+                        continue
+                    
+                    if response.status in retry_status and attempt < 2:
+                        continue
+                    response.raise_for_status()
+                    
+                    content = await response.text()
+                    lines = content.count('\n') + 1
+                    
+                    if Config.CACHE_ENABLED:
+                        self._save_cache(url, content, response.headers)
+                    
+                    self.stats['cache_miss'] += 1
+                    self.stats['success'] += 1
+                    return True, content, lines
+                    
+            except asyncio.TimeoutError:
+                if attempt < 2:
+                    continue
+                self.stats['timeout'] += 1
+                return False, None, 0
+            except aiohttp.ClientConnectionError:
+                if attempt < 2:
+                    continue
+                self.stats['failed'] += 1
+                return False, None, 0
+            except Exception:
+                self.stats['failed'] += 1
+                return False, None, 0
+        
+        self.stats['failed'] += 1
+        return False, None, 0
+
+class StageProfiler:
+    """按阶段的 cProfile 剖析（--profile）
+    
+    主线程在阶段开始/结束时启停剖析器；线程池中的下载/流式解析通过 wrap 在各自线程内剖析，
+    阶段结束时合并。多进程解析（PARSE_WORKERS）的子进程不在剖析范围内。
+    Python 3.12+ 的 cProfile 基于 sys.monitoring，同一时间只允许一个剖析器，
+    此时线程池任务不单独剖析，只记录未捕获的任务数。
+    """
+    
+    THREAD_PROFILING = sys.version_info < (3, 12)
+    
+    def __init__(self, output_dir: str = "stats"):
+        self.output_dir = output_dir
+        self.timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.top_n = Config.PROFILE_TOP_N
+        self.results = {}
+        self._profile = None
+        self._workers = []
+        self._uncaptured = 0
+        self._lock = threading.Lock()
+    
+    def start(self):
+        """阶段开始：在主线程启用剖析器"""
+        self._workers = []
+        self._uncaptured = 0
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+    
+    def wrap(self, func: Callable) -> Callable:
+        """包装线程池任务：阶段进行中时在工作线程内单独剖析，结束后并入当前阶段"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if self._profile is None:
+                return func(*args, **kwargs)
+            profile = cProfile.Profile() if self.THREAD_PROFILING else None
+            if profile is not None:
+                try:
+                    profile.enable()
+                except ValueError:
+                    # 已有其他剖析器处于活动状态（3.12+ 只允许一个）
+                    profile = None
+            if profile is None:
+                with self._lock:
+                    self._uncaptured += 1
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+                with self._lock:
+                    self._workers.append(profile)
+        return wrapper
+    
+    def stop(self, stage_name: str):
+        """阶段结束：合并主线程与工作线程的剖析结果，写入 .pstats 并记录热点函数"""
+        profile, self._profile = self._profile, None
+        if profile is None:
+            return
+        profile.disable()
+        with self._lock:
+            workers, self._workers = self._workers, []
+            uncaptured, self._uncaptured = self._uncaptured, 0
+        
+        stats = pstats.Stats(profile)
+        for worker in workers:
+            stats.add(worker)
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"profile_{self.timestamp}_{stage_name}.pstats")
+        stats.dump_stats(path)
+        
+        self.results[stage_name] = {
+            'file': path,
+            'total_seconds': round(stats.total_tt, 3),
+            'worker_threads': len(workers),
+            'unprofiled_tasks': uncaptured,
+            'top_functions': self._top_functions(stats)
+        }
+        print(f"   🔍 剖析结果: {path}")
+        if uncaptured:
+            print(f"   ⚠️  {uncaptured} 个线程池任务未单独剖析（当前Python仅支持单个活动剖析器）")
+    
+    def _top_functions(self, stats: pstats.Stats) -> List[Dict[str, Any]]:
+        """按自身耗时排序的前N个热点函数"""
+        entries = sorted(stats.stats.items(), key=lambda item: -item[1][2])[:self.top_n]
+        return [{
+            'function': pstats.func_std_string(func),
+            'calls': calls,
+            'self_seconds': round(self_time, 4),
+            'cumulative_seconds': round(cumulative, 4)
+        } for func, (_, calls, self_time, cumulative, _) in entries]
+    
+    def write_summary(self) -> Optional[str]:
+        """写入各阶段热点函数汇总（Markdown）"""
+        if self._profile is not None:
+            # 阶段未正常结束（超时/异常）时停止剖析，不保存不完整的结果
+            self._profile.disable()
+            self._profile = None
+        if not self.results:
+            return None
+        path = os.path.join(self.output_dir, f"profile_{self.timestamp}.md")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"# 阶段剖析热点函数\n\n")
+            f.write(f"按自身耗时排序的前 {self.top_n} 个函数。"
+                    f"完整数据可用 `python -m pstats <文件>` 或 snakeviz 查看。\n\n")
+            for stage_name, result in self.results.items():
+                f.write(f"## {stage_name}\n\n")
+                f.write(f"- **剖析文件**: `{result['file']}`\n")
+                f.write(f"- **剖析总耗时**: {result['total_seconds']}秒"
+                        f"（各线程累加，含 {result['worker_threads']} 个线程池任务）\n")
+                if result.get('unprofiled_tasks'):
+                    f.write(f"- **未剖析的线程池任务**: {result['unprofiled_tasks']}"
+                            f"（Python 3.12+ 仅支持单个活动剖析器）\n")
+                f.write(f"\n")
+                f.write(f"| 函数 | 调用次数 | 自身耗时 | 累计耗时 |\n")
+                f.write(f"|------|----------|----------|----------|\n")
+                for item in result['top_functions']:
+                    f.write(f"| `{item['function']}` | {item['calls']:,} "
+                            f"| {item['self_seconds']:.4f}秒 | {item['cumulative_seconds']:.4f}秒 |\n")
+                f.write(f"\n")
+        print(f"🔍 剖析汇总: {path}")
+        return path
 
 class MultiStageProcessor:
     """多阶段处理器"""
     
     def __init__(self):
         self.start_time = time.time()
+        self._snapshot = None
+        self._trace_start = None
+        self.profiler = None  # --profile 时为 StageProfiler
         self.stats = {
-            'stage1_download': {'time': 0, 'rules': 0},
+            'stage1_download': {'time': 0, 'rules': 0, 'engine': 'thread'},
             'stage2_parse': {'time': 0, 'rules': 0},
             'stage3_dedup': {'time': 0, 'before': 0, 'after': 0},
             'stage4_optimize': {'time': 0, 'before': 0, 'after': 0},
@@ -177,11 +894,111 @@ class MultiStageProcessor:
         print(f"\n{'='*60}")
         print(f"📊 {stage_name}")
         print(f"{'='*60}")
+        self._snapshot = self._take_snapshot()
+        self._trace_start = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.start()
         return time.time()
     
-    def log_stage_end(self, stage_name: str, start_time: float, **kwargs):
-        """记录阶段结束"""
-        elapsed = time.time() - start_time
+    def log_stage_end(self, stage_name: str, start_time: float,
+                      bytes_in: Optional[int] = None, bytes_out: Optional[int] = None, **kwargs):
+        """记录阶段结束（bytes_in/bytes_out 为阶段输入/输出的文本大小）"""
+        if self.profiler is not None:
+            self.profiler.stop(stage_name)
+        self.record_stage(stage_name, time.time() - start_time, **kwargs)
+        if self._trace_start is not None:
+            TRACER.complete(stage_name, 'stage', self._trace_start, **kwargs)
+            self._trace_start = None
+        
+        snapshot, self._snapshot = self._snapshot, None
+        if snapshot is not None:
+            # 阶段1的 rules 为成功的源数量，不计算规则吞吐量
+            rules = None if stage_name == 'stage1_download' else kwargs.get('before', kwargs.get('rules'))
+            metrics = self._collect_metrics(snapshot, rules, bytes_in, bytes_out)
+            self.stats[stage_name]['metrics'] = metrics
+            self._print_metrics(metrics)
+    
+    @staticmethod
+    def _take_snapshot() -> Optional[Dict[str, Any]]:
+        """阶段开始时的资源快照（未启用性能监控时返回None）"""
+        if not Config.ENABLE_PERFORMANCE_MONITORING:
+            return None
+        
+        snapshot = {
+            'wall': time.perf_counter(),
+            'cpu': time.process_time(),
+            'children_cpu': _children_cpu_time()
+        }
+        if Config.LOG_MEMORY_USAGE:
+            snapshot['peak_reset'] = _reset_peak_rss()
+        if Config.TRACEMALLOC_TOP_N > 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            snapshot['tracemalloc'] = True
+        return snapshot
+    
+    @staticmethod
+    def _collect_metrics(snapshot: Dict[str, Any], rules: Optional[int],
+                         bytes_in: Optional[int], bytes_out: Optional[int]) -> Dict[str, Any]:
+        """计算阶段的CPU、内存、吞吐量与输入输出大小"""
+        wall = time.perf_counter() - snapshot['wall']
+        cpu = time.process_time() - snapshot['cpu']
+        metrics = {
+            'wall_seconds': round(wall, 3),
+            'cpu_seconds': round(cpu, 3),
+            'cpu_utilization': round(cpu / wall, 2) if wall > 0 else None
+        }
+        children_cpu = _children_cpu_time() - snapshot['children_cpu']
+        if children_cpu > 0:
+            metrics['children_cpu_seconds'] = round(children_cpu, 3)
+        
+        if Config.LOG_MEMORY_USAGE:
+            memory = _read_proc_memory()
+            if snapshot.get('peak_reset') and 'peak_rss_mb' in memory:
+                metrics['peak_rss_mb'] = memory['peak_rss_mb']
+                metrics['peak_rss_scope'] = 'stage'
+            else:
+                metrics['peak_rss_mb'] = _process_peak_rss_mb()
+                metrics['peak_rss_scope'] = 'process'
+            metrics['rss_end_mb'] = memory.get('rss_mb')
+        
+        if rules is not None:
+            metrics['rules_per_second'] = round(rules / wall) if wall > 0 else None
+        if bytes_in is not None:
+            metrics['bytes_in'] = bytes_in
+        if bytes_out is not None:
+            metrics['bytes_out'] = bytes_out
+        
+        if snapshot.get('tracemalloc'):
+            top = tracemalloc.take_snapshot().statistics('lineno')[:Config.TRACEMALLOC_TOP_N]
+            tracemalloc.stop()
+            metrics['top_allocations'] = [{
+                'location': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                'size_mb': round(stat.size / (1024 * 1024), 2),
+                'count': stat.count
+            } for stat in top]
+        
+        return metrics
+    
+    @staticmethod
+    def _print_metrics(metrics: Dict[str, Any]):
+        parts = [f"CPU {metrics['cpu_seconds']:.2f}s"]
+        if metrics.get('cpu_utilization') is not None:
+            parts[0] += f" ({metrics['cpu_utilization']:.0%})"
+        if metrics.get('peak_rss_mb') is not None:
+            scope = '' if metrics['peak_rss_scope'] == 'stage' else '(进程)'
+            parts.append(f"峰值RSS{scope} {metrics['peak_rss_mb']:.1f}MB")
+        if metrics.get('rules_per_second') is not None:
+            parts.append(f"{metrics['rules_per_second']:,} 条/秒")
+        if 'bytes_in' in metrics or 'bytes_out' in metrics:
+            size_in = format_size(metrics.get('bytes_in'))
+            size_out = format_size(metrics.get('bytes_out'))
+            parts.append(f"输入 {size_in} → 输出 {size_out}")
+        print(f"   📈 {', '.join(parts)}")
+        for item in metrics.get('top_allocations', []):
+            print(f"      {item['size_mb']:8.2f}MB {item['count']:>9,} 次  {item['location']}")
+    
+    def record_stage(self, stage_name: str, elapsed: float, **kwargs):
+        """记录阶段耗时及统计（流水线模式下阶段相互重叠时直接传入耗时）"""
         self.stats[stage_name]['time'] = elapsed
         print(f"✅ 完成，耗时: {elapsed:.2f}秒")
         for key, value in kwargs.items():
@@ -257,24 +1074,413 @@ class SmartRuleParser:
         
         return True
 
+class RuleRecord:
+    """规则记录：解析阶段一次性确定类型与域名，后续各阶段直接复用
+    
+    - text: 原始规则文本
+    - kind: 规则类型（adblock / hosts / domain / other）
+    - domain: 规范化（小写）域名，非域名类规则为None
+    - source: 规则源序号（对应 rule_sources 下标，未知为-1）
+    - priority: 优先级分数，首次访问时计算并缓存
+    """
+    
+    __slots__ = ('text', 'kind', 'domain', 'source', '_priority')
+    
+    ADBLOCK = 'adblock'
+    HOSTS = 'hosts'
+    DOMAIN = 'domain'
+    OTHER = 'other'
+    
+    def __init__(self, text: str, kind: str, domain: Optional[str],
+                 source: int = -1, priority: Optional[int] = None):
+        self.text = text
+        self.kind = kind
+        self.domain = domain
+        self.source = source
+        self._priority = priority
+    
+    @classmethod
+    def from_text(cls, text: str, source: int = -1) -> 'RuleRecord':
+        """从规则文本构建记录（分类与域名提取只在此处进行）"""
+        if text.startswith('|') or '##' in text:
+            kind = cls.ADBLOCK
+            domain = text[2:].split('^')[0] if text.startswith('||') and '^' in text else None
+        elif text.startswith(('0.0.0.0', '127.0.0.1')):
+            kind = cls.HOSTS
+            domain = None
+            if text.startswith(('0.0.0.0 ', '127.0.0.1 ')):
+                parts = text.split()
+                if len(parts) >= 2:
+                    domain = parts[1]
+        elif DOMAIN_PATTERN.match(text):
+            kind = cls.DOMAIN
+            domain = text
+        else:
+            kind = cls.OTHER
+            domain = None
+        
+        return cls(text, kind, domain.lower() if domain else None, source)
+    
+    @staticmethod
+    def from_texts(texts, source: int = -1) -> List['RuleRecord']:
+        from_text = RuleRecord.from_text
+        return [from_text(text, source) for text in texts]
+    
+    @property
+    def priority(self) -> int:
+        if self._priority is None:
+            self._priority = Config.get_priority_score(self.text)
+        return self._priority
+    
+    def __reduce__(self):
+        return (RuleRecord, (self.text, self.kind, self.domain, self.source, self._priority))
+    
+    def __repr__(self):
+        return f"RuleRecord({self.text!r}, {self.kind}, {self.domain!r}, source={self.source})"
+
+def rule_texts(records: List[RuleRecord]) -> List[str]:
+    """取出记录中的规则文本"""
+    return list(map(attrgetter('text'), records))
+
+def rules_text_size(records: List[RuleRecord]) -> int:
+    """规则文本总大小（字符数；规则基本为ASCII，约等于字节数）"""
+    return sum(map(len, map(attrgetter('text'), records)))
+
+RECORD_KINDS = (RuleRecord.ADBLOCK, RuleRecord.HOSTS, RuleRecord.DOMAIN, RuleRecord.OTHER)
+
+def pack_records(records: List[RuleRecord], with_sources: bool = False) -> Dict[str, Any]:
+    """把规则记录打包为紧凑的列式数据（文本/域名按行拼接，类型每条1字节）"""
+    kind_codes = {kind: code for code, kind in enumerate(RECORD_KINDS)}
+    data = {
+        'count': len(records),
+        'texts': '\n'.join(rule.text for rule in records),
+        'kinds': bytes(kind_codes[rule.kind] for rule in records),
+        'domains': '\n'.join(rule.domain or '' for rule in records)
+    }
+    if with_sources:
+        data['sources'] = array('i', (rule.source for rule in records)).tobytes()
+    return data
+
+def unpack_records(data: Dict[str, Any], source: int = -1) -> List[RuleRecord]:
+    """还原 pack_records 的结果；未保存规则源序号时统一使用 source"""
+    if not data['count']:
+        return []
+    texts = data['texts'].split('\n')
+    domains = data['domains'].split('\n')
+    if 'sources' in data:
+        sources = array('i')
+        sources.frombytes(data['sources'])
+    else:
+        sources = repeat(source)
+    return [RuleRecord(text, RECORD_KINDS[kind], domain or None, rule_source)
+            for text, kind, domain, rule_source
+            in zip(texts, data['kinds'], domains, sources)]
+
+class ParsedRuleCache:
+    """单源解析结果缓存：源正文未变化时直接复用上次解析、校验后的规则
+    
+    每个源一个文件，以正文哈希与解析器版本（含影响解析结果的配置）校验；
+    规则以 pack_records 列式数据保存，规则源序号在加载时赋值。
+    启用哈希去重时缓存的是源内精确去重后的规则（全局去重保留首次出现，结果不变），
+    未变化的源进入阶段3时已完成源内合并。
+    """
+    
+    VERSION = 2  # 解析/分类逻辑或存储格式变更时递增
+    
+    def __init__(self):
+        self.enabled = Config.CACHE_ENABLED and Config.PARSED_CACHE_ENABLED
+        self.cache_dir = Path(Config.CACHE_DIR) / 'parsed'
+        self.stats = {'hit': 0, 'miss': 0}
+        
+        settings = {key: getattr(Config, key) for key in PARSE_CONFIG_KEYS}
+        settings['HASH_DEDUP_ENABLED'] = Config.HASH_DEDUP_ENABLED
+        self.parser_key = f"v{self.VERSION}:" + hashlib.sha1(
+            repr(sorted(settings.items())).encode()).hexdigest()[:16]
+    
+    def _get_path(self, url: str) -> Path:
+        url_hash = hashlib.md5(url.encode()).hexdigest()
+        return self.cache_dir / f"parsed_{url_hash}.pickle"
+    
+    def lookup(self, url: str, content_hash: str, source: int = -1
+               ) -> Optional[Tuple[List[RuleRecord], int, int]]:
+        """命中时返回 (规则记录, 源内去重前规则数, 行数)，否则返回None"""
+        if not (self.enabled and content_hash):
+            return None
+        
+        try:
+            with open(self._get_path(url), 'rb') as f:
+                data = pickle.load(f)
+        except Exception:
+            return None
+        
+        if data.get('parser') != self.parser_key or data.get('sha256') != content_hash:
+            return None
+        
+        records = unpack_records(data['records'], source)
+        self.stats['hit'] += 1
+        return records, data['raw_count'], data['lines']
+    
+    def store(self, url: str, content_hash: Optional[str], records: List[RuleRecord],
+              lines: int) -> Tuple[List[RuleRecord], int]:
+        """源内去重并写入缓存，返回 (去重后的规则记录, 去重前规则数)"""
+        if not self.enabled:
+            return records, len(records)
+        
+        self.stats['miss'] += 1
+        raw_count = len(records)
+        if Config.HASH_DEDUP_ENABLED:
+            seen = set()
+            add = seen.add
+            records = [rule for rule in records if not (rule.text in seen or add(rule.text))]
+        
+        if content_hash:
+            data = {
+                'parser': self.parser_key,
+                'sha256': content_hash,
+                'raw_count': raw_count,
+                'lines': lines,
+                'records': pack_records(records)
+            }
+            path = self._get_path(url)
+            tmp_file = path.with_suffix('.tmp')
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                with open(tmp_file, 'wb') as f:
+                    pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_file, path)
+            except OSError:
+                pass
+        
+        return records, raw_count
+
+# ==================== 多进程解析 ====================
+# 解析结果依赖的配置项，传递给子进程以保证与主进程一致
+PARSE_CONFIG_KEYS = ('SKIP_COMMENT_LINES', 'PARSE_MAX_LINE_LENGTH',
+                     'MIN_DOMAIN_LENGTH', 'MAX_DOMAIN_LENGTH')
+
+def _init_parse_worker(settings: Dict[str, Any]):
+    """解析子进程初始化：同步解析相关配置"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for key, value in settings.items():
+        setattr(Config, key, value)
+
+def _parse_text_chunk(source: int, text: str) -> Dict[str, Any]:
+    """解析一段文本并构建规则记录（子进程中执行）
+    
+    返回 pack_records 列式数据而非对象列表，减少回传主进程时的序列化开销。
+    """
+    parse_line = SmartRuleParser.parse_line
+    from_text = RuleRecord.from_text
+    return pack_records([from_text(parsed, source)
+                         for parsed in map(parse_line, text.split('\n')) if parsed])
+
+def _parse_workers() -> int:
+    """实际解析进程数：PARSE_WORKERS 不超过CPU核数"""
+    return min(Config.PARSE_WORKERS, os.cpu_count() or 1)
+
+def _split_text_chunks(content: str, chunk_size: int):
+    """按换行边界把大文本切成若干块，各块按行切分的结果与整体切分一致"""
+    start = 0
+    length = len(content)
+    while True:
+        end = start + chunk_size
+        if end >= length:
+            yield content[start:]
+            return
+        newline = content.find('\n', end)
+        if newline == -1:
+            yield content[start:]
+            return
+        yield content[start:newline]
+        start = newline + 1
+
+class DomainSuffixIndex:
+    """域名后缀索引：判断域名是否已被父域名规则覆盖
+    
+    把域名整体按字符反转（ads.example.com → moc.elpmaxe.sda）并排序后，
+    任一域名的所有子域名在序列中紧随其后且连续，因此一次线性扫描即可
+    找出全部被覆盖的子域名，无需为每个域名拼接各级父域名字符串。
+    """
+    
+    # 标签分隔符需小于域名中可能出现的任何字符，保证子域名紧跟父域名排序
+    SEPARATOR = '\x01'
+    
+    def __init__(self, domains: Collection[str]):
+        # 直接引用调用方的集合/字典，不额外复制
+        self.domains = domains
+    
+    @classmethod
+    def reverse_key(cls, domain: str) -> str:
+        """example.com → moc<SEP>elpmaxe"""
+        return domain.replace('.', cls.SEPARATOR)[::-1]
+    
+    @classmethod
+    def domain_from_key(cls, key: str) -> str:
+        return key[::-1].replace(cls.SEPARATOR, '.')
+    
+    def covered_domains(self) -> Set[str]:
+        """返回所有被索引中其他（父）域名覆盖的域名"""
+        keys = [self.reverse_key(domain) for domain in self.domains]
+        keys.sort()
+        
+        covered = set()
+        root = None
+        for key in keys:
+            if root is not None and key.startswith(root):
+                covered.add(self.domain_from_key(key))
+            else:
+                root = key + self.SEPARATOR
+        return covered
+    
+    def find_parent(self, domain: str) -> Optional[str]:
+        """返回覆盖该域名的最近父域名（不含自身），没有则返回None"""
+        pos = domain.find('.')
+        while pos != -1:
+            parent = domain[pos + 1:]
+            if parent in self.domains:
+                return parent
+            pos = domain.find('.', pos + 1)
+        return None
+    
+    def is_covered(self, domain: str) -> bool:
+        """域名是否被索引中的父域名覆盖"""
+        return self.find_parent(domain) is not None
+
+class PublicSuffixIndex:
+    """公共后缀索引：基于随仓库分发的 Public Suffix List 计算可注册域名
+    
+    列表编译为按反转标签组织的字典树，编译结果以pickle缓存在缓存目录，
+    以源文件哈希区分版本；进程内只加载一次。
+    """
+    
+    CACHE_VERSION = 1
+    FLAG = ''          # 节点标记键（合法标签不可能为空串）
+    RULE = 1
+    EXCEPTION = 2
+    
+    _instance = None
+    
+    def __init__(self, trie: Dict[str, Any]):
+        self.trie = trie
+    
+    @classmethod
+    def load(cls) -> Optional['PublicSuffixIndex']:
+        """加载（或编译）公共后缀索引，失败时返回None"""
+        if cls._instance is not None:
+            return cls._instance
+        
+        try:
+            with open(Config.PUBLIC_SUFFIX_FILE, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            print(f"  ⚠️  公共后缀列表读取失败: {e}")
+            return None
+        
+        digest = hashlib.sha1(data).hexdigest()[:16]
+        cache_file = Path(Config.CACHE_DIR) / f"psl_v{cls.CACHE_VERSION}_{digest}.pickle"
+        
+        trie = None
+        try:
+            with open(cache_file, 'rb') as f:
+                trie = pickle.load(f)
+        except Exception:
+            trie = cls._compile(data.decode('utf-8'))
+            try:
+                cache_file.parent.mkdir(parents=True, exist_ok=True)
+                with open(cache_file, 'wb') as f:
+                    pickle.dump(trie, f, protocol=pickle.HIGHEST_PROTOCOL)
+            except OSError:
+                pass
+        
+        cls._instance = cls(trie)
+        return cls._instance
+    
+    @classmethod
+    def _compile(cls, text: str) -> Dict[str, Any]:
+        """把PSL文本编译为字典树"""
+        trie = {}
+        for line in text.split('\n'):
+            line = line.strip()
+            if not line or line.startswith('//'):
+                continue
+            rule = line.split()[0].lower()
+            
+            flag = cls.RULE
+            if rule.startswith('!'):
+                flag = cls.EXCEPTION
+                rule = rule[1:]
+            
+            variants = [rule]
+            if not rule.isascii():
+                try:
+                    variants.append(rule.encode('idna').decode('ascii'))
+                except UnicodeError:
+                    pass
+            
+            for variant in variants:
+                node = trie
+                for label in reversed(variant.split('.')):
+                    node = node.setdefault(label, {})
+                node[cls.FLAG] = flag
+        return trie
+    
+    def public_suffix_length(self, labels: List[str]) -> int:
+        """返回公共后缀所占的标签数（无匹配规则时按默认规则 \"*\" 计为1）"""
+        node = self.trie
+        suffix_length = 1
+        depth = 0
+        
+        for label in reversed(labels):
+            child = node.get(label)
+            wildcard = node.get('*')
+            if child is None and wildcard is None:
+                break
+            depth += 1
+            
+            if child is not None:
+                flag = child.get(self.FLAG)
+                if flag == self.EXCEPTION:
+                    # 例外规则优先：公共后缀为该规则去掉最左侧标签
+                    return depth - 1
+                if flag == self.RULE:
+                    suffix_length = depth
+            if wildcard is not None and wildcard.get(self.FLAG) == self.RULE:
+                suffix_length = depth
+            
+            node = child if child is not None else wildcard
+        
+        return suffix_length
+    
+    def registrable_domain(self, domain: str) -> str:
+        """返回可注册域名（如 a.b.example.co.uk → example.co.uk）；
+        域名本身就是公共后缀时原样返回"""
+        labels = domain.lower().split('.')
+        suffix_length = self.public_suffix_length(labels)
+        if suffix_length >= len(labels):
+            return '.'.join(labels)
+        return '.'.join(labels[-(suffix_length + 1):])
+
 class MultiStageDeduplicator:
     """多阶段去重器"""
     
     def __init__(self):
         self.stats = {
-            'stage1_hash': {'before': 0, 'after': 0},
+            'stage1_hash': {'before': 0, 'after': 0, 'mode': 'exact', 'time': 0, 'peak_memory_mb': None},
             'stage2_domain': {'before': 0, 'after': 0},
-            'stage3_subdomain': {'before': 0, 'after': 0},
+            'stage3_subdomain': {'before': 0, 'after': 0, 'time': 0},
             'total_removed': 0
         }
     
-    def deduplicate(self, rules: List[str]) -> List[str]:
-        """多阶段去重"""
+    def deduplicate(self, rules: List[RuleRecord], skip_subdomain: bool = False) -> List[RuleRecord]:
+        """多阶段去重（skip_subdomain：时间预算不足时跳过子域名优化）"""
         if not rules:
             return []
         
         print(f"  开始多阶段去重 {len(rules):,} 条规则...")
         
+        if Config.EXTERNAL_DEDUP_ENABLED and len(rules) >= Config.EXTERNAL_DEDUP_MIN_RULES:
+            return self._external_deduplicate(rules, skip_subdomain)
+        
         current_rules = rules.copy()
         
         # 第一阶段：哈希去重（快速）
@@ -286,7 +1492,7 @@ class MultiStageDeduplicator:
             current_rules = self._domain_deduplicate(current_rules)
         
         # 第三阶段：子域名优化
-        if Config.SUBDOMAIN_OPTIMIZATION:
+        if Config.SUBDOMAIN_OPTIMIZATION and not skip_subdomain:
             current_rules = self._subdomain_optimize(current_rules)
         
         total_removed = len(rules) - len(current_rules)
@@ -296,31 +1502,72 @@ class MultiStageDeduplicator:
         
         return current_rules
     
-    def _hash_deduplicate(self, rules: List[str]) -> List[str]:
-        """哈希去重（第一阶段）"""
+    @traced('dedup')
+    def _hash_deduplicate(self, rules: List[RuleRecord]) -> List[RuleRecord]:
+        """哈希去重（第一阶段），保留首次出现的顺序"""
         start_time = time.time()
         before = len(rules)
         
-        seen = set()
-        unique_rules = []
+        mode = Config.HASH_DEDUP_MODE
+        if mode == 'fingerprint':
+            try:
+                import numpy
+            except ImportError:
+                print("    ⚠️  未安装numpy，指纹去重回退为精确去重")
+                mode = 'exact'
         
-        for rule in rules:
-            rule_hash = hashlib.md5(rule.encode()).hexdigest()
-            if rule_hash not in seen:
-                seen.add(rule_hash)
-                unique_rules.append(rule)
+        if mode == 'fingerprint':
+            unique_rules, peak_mb = measure_peak_memory(self._fingerprint_unique, rules)
+        else:
+            unique_rules, peak_mb = measure_peak_memory(self._exact_unique, rules)
         
         after = len(unique_rules)
         elapsed = time.time() - start_time
         
-        self.stats['stage1_hash']['before'] = before
-        self.stats['stage1_hash']['after'] = after
+        self.stats['stage1_hash'].update({
+            'before': before,
+            'after': after,
+            'mode': mode,
+            'time': round(elapsed, 3),
+            'peak_memory_mb': peak_mb
+        })
         
-        print(f"    🎯 哈希去重: {before:,} → {after:,} 条 (-{before-after:,}), 耗时: {elapsed:.2f}s")
+        memory_info = f", 内存峰值: {peak_mb:.1f}MB" if peak_mb is not None else ""
+        print(f"    🎯 哈希去重({mode}): {before:,} → {after:,} 条 (-{before-after:,}), "
+              f"耗时: {elapsed:.2f}s{memory_info}")
         
         return unique_rules
     
-    def _domain_deduplicate(self, rules: List[str]) -> List[str]:
+    @staticmethod
+    def _exact_unique(rules: List[RuleRecord]) -> List[RuleRecord]:
+        """精确去重：直接以规则文本为键（复用字符串自带的哈希缓存）"""
+        seen = set()
+        add = seen.add
+        return [rule for rule in rules if not (rule.text in seen or add(rule.text))]
+    
+    @staticmethod
+    def _fingerprint_unique(rules: List[RuleRecord]) -> List[RuleRecord]:
+        """64位指纹去重：每条规则只占8字节，适合超大语料
+        
+        指纹取自进程内的字符串哈希，同一次运行中稳定；
+        64位碰撞概率极低（2000万条约为1e-5），碰撞时仅多移除一条规则。
+        """
+        import numpy as np
+        
+        count = len(rules)
+        fingerprints = np.fromiter(map(hash, map(attrgetter('text'), rules)),
+                                   dtype=np.int64, count=count)
+        _, first_index = np.unique(fingerprints, return_index=True)
+        del fingerprints
+        
+        keep = np.zeros(count, dtype=bool)
+        keep[first_index] = True
+        del first_index
+        
+        return list(compress(rules, keep))
+    
+    @traced('dedup')
+    def _domain_deduplicate(self, rules: List[RuleRecord]) -> List[RuleRecord]:
         """域名级去重（第二阶段）"""
         start_time = time.time()
         before = len(rules)
@@ -330,7 +1577,7 @@ class MultiStageDeduplicator:
         other_rules = []
         
         for rule in rules:
-            domain = self._extract_domain(rule)
+            domain = rule.domain
             if domain:
                 # 每个域名只保留一条规则（优先保留更通用的）
                 if domain not in domain_rules:
@@ -338,7 +1585,7 @@ class MultiStageDeduplicator:
                 else:
                     # 如果新规则更通用（更短或包含通配符），则替换
                     existing = domain_rules[domain]
-                    if self._is_more_general(rule, existing):
+                    if self._is_more_general(rule.text, existing.text):
                         domain_rules[domain] = rule
             else:
                 other_rules.append(rule)
@@ -355,7 +1602,8 @@ class MultiStageDeduplicator:
         
         return result
     
-    def _subdomain_optimize(self, rules: List[str]) -> List[str]:
+    @traced('dedup')
+    def _subdomain_optimize(self, rules: List[RuleRecord]) -> List[RuleRecord]:
         """子域名优化（第三阶段）"""
         if len(rules) < 10000:  # 规则较少时跳过
             return rules
@@ -368,62 +1616,220 @@ class MultiStageDeduplicator:
         other_rules = []
         
         for rule in rules:
-            domain = self._extract_domain(rule)
-            if domain:
-                domain_to_rule[domain] = rule
+            if rule.domain:
+                domain_to_rule[rule.domain] = rule
             else:
                 other_rules.append(rule)
         
-        # 构建域名树
-        domain_tree = {}
-        for domain in domain_to_rule.keys():
-            parts = domain.split('.')
-            current = domain_tree
-            for part in reversed(parts):
-                if part not in current:
-                    current[part] = {}
-                current = current[part]
-        
-        # 优化：移除不必要的子域名
-        optimized_domains = set()
-        for domain in domain_to_rule.keys():
-            parts = domain.split('.')
-            current = domain_tree
-            
-            # 检查是否是其他域名的子域名
-            is_subdomain = False
-            for i in range(1, len(parts)):
-                parent = '.'.join(parts[i:])
-                if parent in domain_to_rule:
-                    is_subdomain = True
-                    break
-            
-            if not is_subdomain:
-                optimized_domains.add(domain)
+        # 优化：移除已被父域名覆盖的子域名（保持原有顺序）
+        covered = DomainSuffixIndex(domain_to_rule).covered_domains()
         
         # 构建结果
-        result = [domain_to_rule[d] for d in optimized_domains] + other_rules
+        result = [rule for domain, rule in domain_to_rule.items()
+                  if domain not in covered] + other_rules
         after = len(result)
         elapsed = time.time() - start_time
         
-        self.stats['stage3_subdomain']['before'] = before
-        self.stats['stage3_subdomain']['after'] = after
+        self.stats['stage3_subdomain'].update({'before': before, 'after': after, 'time': round(elapsed, 3)})
         
         print(f"    🎯 子域名优化: {before:,} → {after:,} 条 (-{before-after:,}), 耗时: {elapsed:.2f}s")
         
         return result
     
-    def _extract_domain(self, rule: str) -> Optional[str]:
-        """从规则中提取域名"""
-        if rule.startswith('||') and '^' in rule:
-            return rule[2:].split('^')[0]
-        elif rule.startswith(('0.0.0.0 ', '127.0.0.1 ')):
-            parts = rule.split()
-            if len(parts) >= 2:
-                return parts[1]
-        elif DOMAIN_PATTERN.match(rule):
-            return rule
-        return None
+    # ==================== 外存去重 ====================
+    # 桶文件中的条目: (分组, 原始序号, 文本, 类型, 域名, 规则源)
+    # 分组0为域名规则、1为其他规则，按 (分组, 序号) 排序即为内存去重的输出顺序
+    RECORD_MEMORY_ESTIMATE = 512   # 单条规则在桶内去重时的内存估算（字节）
+    SPILL_BATCH_SIZE = 20000       # 每批写入桶文件的条目数
+    
+    @traced('dedup')
+    def _external_deduplicate(self, rules: List[RuleRecord], skip_subdomain: bool = False) -> List[RuleRecord]:
+        """外存去重：分桶落盘，逐桶完成三阶段去重后按原顺序归并
+        
+        - 域名规则按末两级域名分桶，父子域名必然落在同一桶；单级域名（如 com）
+          极少，全局保留在内存中用于子域名覆盖判断
+        - 非域名规则按文本分桶，只参与哈希去重
+        - 桶内结果按 (分组, 序号) 有序，多路归并后与内存去重结果完全一致
+        
+        分桶完成后清空输入列表，原始规则不再常驻内存。
+        """
+        start_time = time.time()
+        before = len(rules)
+        budget = Config.DEDUP_MEMORY_BUDGET_MB * 1024 * 1024
+        bucket_count = max(2, -(-before * self.RECORD_MEMORY_ESTIMATE // budget))
+        
+        cache_dir = Path(Config.CACHE_DIR)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryDirectory(prefix='dedup_', dir=cache_dir) as work_dir:
+            paths = [Path(work_dir) / f"bucket_{i:04d}.pickle" for i in range(bucket_count)]
+            tld_domains = self._spill_buckets(rules, paths)
+            rules.clear()
+            
+            spilled_mb = sum(path.stat().st_size for path in paths) / (1024 * 1024)
+            print(f"    💾 外存去重: {before:,} 条规则写入 {bucket_count} 个桶 "
+                  f"({spilled_mb:.1f}MB, 内存预算 {Config.DEDUP_MEMORY_BUDGET_MB}MB)")
+            
+            # 第一、二阶段：逐桶哈希去重与域名去重，结果写回桶文件
+            hashed = deduped = largest = 0
+            for path in paths:
+                entries = self._load_bucket(path)
+                largest = max(largest, len(entries))
+                hash_count, entries = self._dedup_bucket(entries)
+                hashed += hash_count
+                deduped += len(entries)
+                self._write_bucket(path, entries)
+            
+            if Config.HASH_DEDUP_ENABLED:
+                self.stats['stage1_hash'].update({
+                    'before': before,
+                    'after': hashed,
+                    'mode': 'exact',
+                    'time': round(time.time() - start_time, 3)
+                })
+                print(f"    🎯 哈希去重(外存): {before:,} → {hashed:,} 条 (-{before-hashed:,})")
+            if Config.DOMAIN_DEDUP_ENABLED:
+                self.stats['stage2_domain'].update({'before': hashed, 'after': deduped})
+                print(f"    🎯 域名去重(外存): {hashed:,} → {deduped:,} 条 (-{hashed-deduped:,})")
+            
+            # 第三阶段：逐桶子域名优化（与内存模式一致，规则较少时跳过）
+            after = deduped
+            if Config.SUBDOMAIN_OPTIMIZATION and not skip_subdomain and deduped >= 10000:
+                subdomain_start = time.time()
+                after = 0
+                for path in paths:
+                    entries = self._collapse_bucket(self._load_bucket(path), tld_domains)
+                    after += len(entries)
+                    self._write_bucket(path, entries)
+                self.stats['stage3_subdomain'].update({
+                    'before': deduped,
+                    'after': after,
+                    'time': round(time.time() - subdomain_start, 3)
+                })
+                print(f"    🎯 子域名优化(外存): {deduped:,} → {after:,} 条 (-{deduped-after:,})")
+            
+            # 多路归并各桶结果
+            result = [RuleRecord(text, kind, domain, source)
+                      for _, _, text, kind, domain, source
+                      in heapq.merge(*map(self._iter_bucket, paths))]
+        
+        elapsed = time.time() - start_time
+        self.stats['external'] = {
+            'buckets': bucket_count,
+            'largest_bucket': largest,
+            'spilled_mb': round(spilled_mb, 2),
+            'memory_budget_mb': Config.DEDUP_MEMORY_BUDGET_MB,
+            'time': round(elapsed, 3)
+        }
+        self.stats['total_removed'] = before - len(result)
+        
+        print(f"  去重完成: {len(result):,} 条 (移除 {before - len(result):,} 条), "
+              f"耗时: {elapsed:.2f}s, 最大桶 {largest:,} 条")
+        
+        return result
+    
+    @traced('dedup')
+    def _spill_buckets(self, rules: List[RuleRecord], paths: List[Path]) -> Set[str]:
+        """把规则分桶写入磁盘，返回单级域名集合"""
+        bucket_count = len(paths)
+        batch_size = self.SPILL_BATCH_SIZE
+        buffers = [[] for _ in paths]
+        tld_domains = set()
+        
+        files = [open(path, 'wb') for path in paths]
+        try:
+            for index, rule in enumerate(rules):
+                domain = rule.domain
+                if domain:
+                    last_dot = domain.rfind('.')
+                    if last_dot == -1:
+                        tld_domains.add(domain)
+                    # 末两级域名（a.b.example.com → example.com）
+                    key = domain[domain.rfind('.', 0, last_dot) + 1:] if last_dot > 0 else domain
+                else:
+                    key = rule.text
+                
+                bucket = hash(key) % bucket_count
+                buffer = buffers[bucket]
+                buffer.append((0, index, rule.text, rule.kind, domain, rule.source))
+                if len(buffer) >= batch_size:
+                    pickle.dump(buffer, files[bucket], protocol=pickle.HIGHEST_PROTOCOL)
+                    buffers[bucket] = []
+            
+            for f, buffer in zip(files, buffers):
+                if buffer:
+                    pickle.dump(buffer, f, protocol=pickle.HIGHEST_PROTOCOL)
+        finally:
+            for f in files:
+                f.close()
+        
+        return tld_domains
+    
+    @staticmethod
+    def _iter_bucket(path: Path):
+        """逐条读取桶文件"""
+        with open(path, 'rb') as f:
+            while True:
+                try:
+                    batch = pickle.load(f)
+                except EOFError:
+                    return
+                yield from batch
+    
+    @classmethod
+    def _load_bucket(cls, path: Path) -> List[tuple]:
+        return list(cls._iter_bucket(path))
+    
+    @classmethod
+    def _write_bucket(cls, path: Path, entries: List[tuple]):
+        batch_size = cls.SPILL_BATCH_SIZE
+        with open(path, 'wb') as f:
+            for start in range(0, len(entries), batch_size):
+                pickle.dump(entries[start:start + batch_size], f, protocol=pickle.HIGHEST_PROTOCOL)
+    
+    def _dedup_bucket(self, entries: List[tuple]) -> Tuple[int, List[tuple]]:
+        """桶内哈希去重与域名去重，返回 (哈希去重后条数, 域名去重结果)"""
+        if Config.HASH_DEDUP_ENABLED:
+            seen = set()
+            add = seen.add
+            entries = [entry for entry in entries if not (entry[2] in seen or add(entry[2]))]
+        hashed = len(entries)
+        
+        if Config.DOMAIN_DEDUP_ENABLED:
+            domain_entries = {}
+            other_entries = []
+            for entry in entries:
+                domain = entry[4]
+                if domain:
+                    existing = domain_entries.get(domain)
+                    if existing is None:
+                        domain_entries[domain] = entry
+                    elif self._is_more_general(entry[2], existing[2]):
+                        # 换成更通用的规则，位置仍取该域名首次出现处
+                        domain_entries[domain] = existing[:2] + entry[2:]
+                else:
+                    other_entries.append((1,) + entry[1:])
+            entries = list(domain_entries.values()) + other_entries
+        
+        return hashed, entries
+    
+    @staticmethod
+    def _collapse_bucket(entries: List[tuple], tld_domains: Set[str]) -> List[tuple]:
+        """桶内子域名优化：桶内父域名与全局单级域名共同判断覆盖"""
+        domain_entries = {}
+        other_entries = []
+        for entry in entries:
+            domain = entry[4]
+            if domain:
+                existing = domain_entries.get(domain)
+                domain_entries[domain] = entry if existing is None else (0, existing[1]) + entry[2:]
+            else:
+                other_entries.append((1,) + entry[1:])
+        
+        covered = DomainSuffixIndex(domain_entries).covered_domains()
+        result = [entry for domain, entry in domain_entries.items()
+                  if domain not in covered and not (
+                      '.' in domain and domain[domain.rfind('.') + 1:] in tld_domains)]
+        return result + other_entries
     
     def _is_more_general(self, rule1: str, rule2: str) -> bool:
         """判断rule1是否比rule2更通用"""
@@ -449,10 +1855,11 @@ class AdvancedRuleOptimizer:
             'by_priority': 0,
             'by_validation': 0,
             'by_quality': 0,
+            'by_limit': 0,
             'total_removed': 0
         }
     
-    def optimize(self, rules: List[str]) -> List[str]:
+    def optimize(self, rules: List[RuleRecord]) -> List[RuleRecord]:
         """优化规则"""
         if not rules:
             return []
@@ -482,16 +1889,14 @@ class AdvancedRuleOptimizer:
         
         return current_rules
     
-    def _filter_by_priority(self, rules: List[str]) -> List[str]:
+    @traced('optimize')
+    def _filter_by_priority(self, rules: List[RuleRecord]) -> List[RuleRecord]:
         """按优先级过滤"""
         start_time = time.time()
         before = len(rules)
         
-        filtered_rules = []
-        for rule in rules:
-            score = Config.get_priority_score(rule)
-            if score >= Config.MIN_RULE_PRIORITY:
-                filtered_rules.append(rule)
+        # rule.priority 由 Config.get_priority_score 计算并缓存在记录上，排序时复用
+        filtered_rules = [rule for rule in rules if rule.priority >= Config.MIN_RULE_PRIORITY]
         
         after = len(filtered_rules)
         elapsed = time.time() - start_time
@@ -501,14 +1906,15 @@ class AdvancedRuleOptimizer:
         
         return filtered_rules
     
-    def _validate_rules(self, rules: List[str]) -> List[str]:
+    @traced('optimize')
+    def _validate_rules(self, rules: List[RuleRecord]) -> List[RuleRecord]:
         """验证规则有效性"""
         start_time = time.time()
         before = len(rules)
         
         valid_rules = []
         for rule in rules:
-            if SmartRuleParser.is_valid_rule(rule):
+            if SmartRuleParser.is_valid_rule(rule.text):
                 valid_rules.append(rule)
         
         after = len(valid_rules)
@@ -519,7 +1925,8 @@ class AdvancedRuleOptimizer:
         
         return valid_rules
     
-    def _filter_by_quality(self, rules: List[str]) -> List[str]:
+    @traced('optimize')
+    def _filter_by_quality(self, rules: List[RuleRecord]) -> List[RuleRecord]:
         """按质量过滤"""
         start_time = time.time()
         before = len(rules)
@@ -539,27 +1946,29 @@ class AdvancedRuleOptimizer:
         
         return quality_rules
     
-    def _is_low_quality(self, rule: str) -> bool:
+    def _is_low_quality(self, rule: RuleRecord) -> bool:
         """判断是否为低质量规则"""
+        text = rule.text
+        
         # 规则过长或过短
-        if len(rule) < 3 or len(rule) > 500:
+        if len(text) < 3 or len(text) > 500:
             return True
         
         # 包含过多特殊字符
         special_chars = ['*', '^', '|', '#', '!']
-        char_count = sum(1 for char in rule if char in special_chars)
+        char_count = sum(1 for char in text if char in special_chars)
         if char_count > 5:
             return True
         
         # 疑似无效的域名
-        if rule.startswith('||') and '^' in rule:
-            domain = rule[2:].split('^')[0]
-            if len(domain.split('.')) > 5:  # 过多子域名
+        if rule.kind == RuleRecord.ADBLOCK and rule.domain is not None:
+            if rule.domain.count('.') > 4:  # 过多子域名
                 return True
         
         return False
     
-    def _classify_and_limit(self, rules: List[str]) -> List[str]:
+    @traced('optimize')
+    def _classify_and_limit(self, rules: List[RuleRecord]) -> List[RuleRecord]:
         """分类并应用数量限制"""
         start_time = time.time()
         
@@ -569,29 +1978,29 @@ class AdvancedRuleOptimizer:
         domain_rules = []
         
         for rule in rules:
-            if rule.startswith('||') or '##' in rule or rule.startswith('|'):
+            if rule.kind == RuleRecord.ADBLOCK:
                 adblock_rules.append(rule)
-            elif rule.startswith('0.0.0.0') or rule.startswith('127.0.0.1'):
+            elif rule.kind == RuleRecord.HOSTS:
                 hosts_rules.append(rule)
-            elif DOMAIN_PATTERN.match(rule):
+            elif rule.kind == RuleRecord.DOMAIN:
                 domain_rules.append(rule)
         
-        # 应用限制
-        adblock_rules = adblock_rules[:Config.MAX_ADBLOCK_RULES]
-        hosts_rules = hosts_rules[:Config.MAX_HOSTS_RULES]
-        domain_rules = domain_rules[:Config.MAX_DOMAIN_RULES]
+        before = len(adblock_rules) + len(hosts_rules) + len(domain_rules)
+        
+        # 应用限制：超限时保留优先级最高（同分取更短）的规则
+        adblock_rules = self._select_top(adblock_rules, Config.MAX_ADBLOCK_RULES)
+        hosts_rules = self._select_top(hosts_rules, Config.MAX_HOSTS_RULES)
+        domain_rules = self._select_top(domain_rules, Config.MAX_DOMAIN_RULES)
         
         # 合并
         result = adblock_rules + hosts_rules + domain_rules
-        result = result[:Config.MAX_TOTAL_RULES]
+        result = self._select_top(result, Config.MAX_TOTAL_RULES)
+        self.stats['by_limit'] = before - len(result)
         
-        # 按优先级排序
-        if Config.SORT_BY_PRIORITY:
-            result.sort(key=lambda x: Config.get_priority_score(x), reverse=True)
-        
-        # 按长度排序
-        if Config.SORT_BY_LENGTH:
-            result.sort(key=lambda x: len(x))
+        # 输出排序：一次排序，等价于先按优先级降序、再按长度稳定排序
+        sort_key = self._output_sort_key()
+        if sort_key is not None:
+            result.sort(key=sort_key)
         
         elapsed = time.time() - start_time
         
@@ -603,6 +2012,45 @@ class AdvancedRuleOptimizer:
         print(f"      耗时: {elapsed:.2f}s")
         
         return result
+    
+    @staticmethod
+    def _selection_key(rule: RuleRecord) -> Tuple[int, int]:
+        """数量限制的保留顺序：优先级高者优先，同分时较短者优先"""
+        return -rule.priority, len(rule.text)
+    
+    def _select_top(self, rules: List[RuleRecord], limit: int) -> List[RuleRecord]:
+        """保留按 _selection_key 排名前limit的规则，结果保持原有相对顺序
+        
+        上限远小于规则数时用堆选取（O(n log k)），否则整体排序后截取；
+        两者对同分规则都保留先出现者。
+        """
+        if len(rules) <= limit:
+            return rules
+        if limit <= 0:
+            return []
+        
+        if limit * 4 < len(rules):
+            selected = heapq.nsmallest(limit, rules, key=self._selection_key)
+        else:
+            selected = sorted(rules, key=self._selection_key)[:limit]
+        
+        keep = set(map(id, selected))
+        return [rule for rule in rules if id(rule) in keep]
+    
+    @staticmethod
+    def _output_sort_key() -> Optional[Callable[[RuleRecord], Any]]:
+        """输出排序键：长度为主键，优先级（降序）为次键，规则文本为最终键
+        
+        同长度同优先级的规则按文本排序，输入不变时输出逐字节一致（差量补丁为空）；
+        均未启用时返回None。
+        """
+        if Config.SORT_BY_LENGTH and Config.SORT_BY_PRIORITY:
+            return lambda rule: (len(rule.text), -rule.priority, rule.text)
+        if Config.SORT_BY_LENGTH:
+            return lambda rule: (len(rule.text), rule.text)
+        if Config.SORT_BY_PRIORITY:
+            return lambda rule: (-rule.priority, rule.text)
+        return None
 
 class SecondaryOptimizer:
     """二次优化器"""
@@ -610,12 +2058,30 @@ class SecondaryOptimizer:
     def __init__(self):
         self.stats = {
             'expired_removed': 0,
+            'expired_by_pattern': {},
             'similar_merged': 0,
+            'merge_time': 0,
             'total_removed': 0
         }
+        self.suffix_index = PublicSuffixIndex.load() if Config.USE_PUBLIC_SUFFIX_LIST else None
+        
+        # 过期模式编译为一个分支表达式，每条规则只匹配一次；
+        # 命中后再按配置顺序确定具体模式（与逐个匹配时的归属一致）
+        patterns = Config.EXPIRED_DOMAIN_PATTERNS
+        self.expired_matcher = re.compile(
+            '|'.join(f'(?:{pattern})' for pattern in patterns), re.IGNORECASE
+        ) if patterns else None
+        self.expired_patterns = [(pattern, re.compile(pattern, re.IGNORECASE))
+                                 for pattern in patterns]
     
-    def optimize(self, rules: List[str]) -> List[str]:
-        """二次优化"""
+    def _base_domain(self, domain: str) -> str:
+        """取主域名（可注册域名）；公共后缀列表不可用时退化为最后两级"""
+        if self.suffix_index is not None:
+            return self.suffix_index.registrable_domain(domain)
+        return '.'.join(domain.split('.')[-2:])
+    
+    def optimize(self, rules: List[RuleRecord], skip_merge: bool = False) -> List[RuleRecord]:
+        """二次优化（skip_merge：时间预算不足时跳过相似规则合并）"""
         if not Config.ENABLE_SECONDARY_OPTIMIZATION or len(rules) < 1000:
             return rules
         
@@ -628,7 +2094,7 @@ class SecondaryOptimizer:
             current_rules = self._remove_expired_domains(current_rules)
         
         # 2. 合并相似规则
-        if Config.MERGE_SIMILAR_RULES:
+        if Config.MERGE_SIMILAR_RULES and not skip_merge:
             current_rules = self._merge_similar_rules(current_rules)
         
         total_removed = len(rules) - len(current_rules)
@@ -638,38 +2104,45 @@ class SecondaryOptimizer:
         
         return current_rules
     
-    def _remove_expired_domains(self, rules: List[str]) -> List[str]:
+    @traced('optimize')
+    def _remove_expired_domains(self, rules: List[RuleRecord]) -> List[RuleRecord]:
         """移除过期域名"""
+        if self.expired_matcher is None:
+            return rules
+        
         start_time = time.time()
         before = len(rules)
         
-        # 常见过期域名模式
-        expired_patterns = [
-            r'\d{8,}',  # 包含8位以上数字（可能是日期）
-            r'20\d{2}[01]\d[0-3]\d',  # 日期格式
-            r'expired', r'old', r'dead', r'invalid',
-            r'test', r'example', r'dummy'
-        ]
-        
+        search = self.expired_matcher.search
         filtered_rules = []
+        removed_rules = []
         for rule in rules:
-            skip = False
-            for pattern in expired_patterns:
-                if re.search(pattern, rule, re.IGNORECASE):
-                    skip = True
-                    break
-            if not skip:
+            if search(rule.text):
+                removed_rules.append(rule)
+            else:
                 filtered_rules.append(rule)
         
+        # 统计各模式命中数（仅对被移除的少量规则再做归属）
+        by_pattern = defaultdict(int)
+        for rule in removed_rules:
+            for pattern, compiled in self.expired_patterns:
+                if compiled.search(rule.text):
+                    by_pattern[pattern] += 1
+                    break
+        
         after = len(filtered_rules)
         elapsed = time.time() - start_time
         
         self.stats['expired_removed'] = before - after
+        self.stats['expired_by_pattern'] = dict(by_pattern)
         print(f"    🎯 移除过期域名: {before:,} → {after:,} 条 (-{before-after:,}), 耗时: {elapsed:.2f}s")
+        for pattern, count in sorted(by_pattern.items(), key=lambda x: -x[1]):
+            print(f"      {pattern}: {count:,}")
         
         return filtered_rules
     
-    def _merge_similar_rules(self, rules: List[str]) -> List[str]:
+    @traced('optimize')
+    def _merge_similar_rules(self, rules: List[RuleRecord]) -> List[RuleRecord]:
         """合并相似规则"""
         if len(rules) < 5000:  # 规则较少时跳过
             return rules
@@ -683,20 +2156,16 @@ class SecondaryOptimizer:
         domain_groups = defaultdict(list)
         other_rules = []
         
+        groups_by_kind = {
+            RuleRecord.ADBLOCK: adblock_groups,
+            RuleRecord.HOSTS: hosts_groups,
+            RuleRecord.DOMAIN: domain_groups
+        }
+        
         for rule in rules:
-            if rule.startswith('||') and '^' in rule:
-                domain = rule[2:].split('^')[0]
-                base_domain = '.'.join(domain.split('.')[-2:])  # 取主域名
-                adblock_groups[base_domain].append(rule)
-            elif rule.startswith(('0.0.0.0 ', '127.0.0.1 ')):
-                parts = rule.split()
-                if len(parts) >= 2:
-                    domain = parts[1]
-                    base_domain = '.'.join(domain.split('.')[-2:])
-                    hosts_groups[base_domain].append(rule)
-            elif DOMAIN_PATTERN.match(rule):
-                base_domain = '.'.join(rule.split('.')[-2:])
-                domain_groups[base_domain].append(rule)
+            groups = groups_by_kind.get(rule.kind)
+            if groups is not None and rule.domain:
+                groups[self._base_domain(rule.domain)].append(rule)  # 取主域名
             else:
                 other_rules.append(rule)
         
@@ -710,8 +2179,8 @@ class SecondaryOptimizer:
                 else:
                     # 选择最优的规则（最短的或包含通配符的）
                     best_rule = min(group_rules, key=lambda x: (
-                        len(x),
-                        0 if '*' in x else 1  # 优先选择包含通配符的
+                        len(x.text),
+                        0 if '*' in x.text else 1  # 优先选择包含通配符的
                     ))
                     merged_rules.append(best_rule)
         
@@ -720,15 +2189,272 @@ class SecondaryOptimizer:
         elapsed = time.time() - start_time
         
         self.stats['similar_merged'] = before - after
+        self.stats['merge_time'] = round(elapsed, 3)
         print(f"    🎯 合并相似规则: {before:,} → {after:,} 条 (-{before-after:,}), 耗时: {elapsed:.2f}s")
         
         return merged_rules
 
+class ArtifactWriter:
+    """dist 产物写入器：一次写入同时计算 SHA-256 并生成预压缩副本（.gz，可选 .br / .zst）
+    
+    文件头（含生成时间）与规则正文分别计算哈希：rules_sha256 只覆盖正文，规则未变化时保持不变，
+    客户端对比 manifest.json 即可跳过下载。gzip 副本不含时间戳，相同内容的压缩结果一致。
+    """
+    
+    EXTENSIONS = {'gzip': '.gz', 'brotli': '.br', 'zstd': '.zst'}
+    BATCH_LINES = 10000
+    
+    def __init__(self, path: str, formats: List[str]):
+        self.path = path
+        self.rules = 0
+        self.entry = None
+        self._file = open(path, 'wb')
+        self._hash = hashlib.sha256()
+        self._rules_hash = hashlib.sha256()
+        self._size = 0
+        self._compressed = []
+        for name in formats:
+            compress, finish = self._create_compressor(name)
+            compressed_path = path + self.EXTENSIONS[name]
+            self._compressed.append({
+                'format': name,
+                'path': compressed_path,
+                'file': open(compressed_path, 'wb'),
+                'compress': compress,
+                'finish': finish,
+                'hash': hashlib.sha256(),
+                'size': 0
+            })
+    
+    @staticmethod
+    def _create_compressor(name: str) -> Tuple[Callable[[bytes], bytes], Callable[[], bytes]]:
+        """返回 (压缩函数, 结束函数)"""
+        if name == 'gzip':
+            compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+            return compressor.compress, compressor.flush
+        if name == 'brotli':
+            import brotli
+            compressor = brotli.Compressor(quality=11)
+            return compressor.process, compressor.finish
+        if name == 'zstd':
+            import zstandard
+            compressor = zstandard.ZstdCompressor(level=19).compressobj()
+            return compressor.compress, compressor.flush
+        raise ValueError(f"不支持的压缩格式: {name}")
+    
+    @classmethod
+    def available_formats(cls) -> List[str]:
+        """Config.DIST_COMPRESSION 中可用的压缩格式（brotli / zstandard 未安装时跳过）"""
+        modules = {'brotli': 'brotli', 'zstd': 'zstandard'}
+        formats = []
+        for name in Config.DIST_COMPRESSION:
+            if name not in cls.EXTENSIONS:
+                print(f"  ⚠️  未知压缩格式 {name}，已忽略")
+                continue
+            if name in modules:
+                try:
+                    __import__(modules[name])
+                except ImportError:
+                    print(f"  ⚠️  未安装 {modules[name]}，跳过 {cls.EXTENSIONS[name]} 压缩")
+                    continue
+            formats.append(name)
+        return formats
+    
+    def _emit(self, data: bytes):
+        self._file.write(data)
+        self._hash.update(data)
+        self._size += len(data)
+        for item in self._compressed:
+            self._write_compressed(item, item['compress'](data))
+    
+    @staticmethod
+    def _write_compressed(item: Dict[str, Any], data: bytes):
+        if data:
+            item['file'].write(data)
+            item['hash'].update(data)
+            item['size'] += len(data)
+    
+    def write_header(self, text: str):
+        """写入文件头（不计入 rules_sha256）"""
+        self._emit(text.encode('utf-8'))
+    
+    def write(self, text: str):
+        """写入规则正文"""
+        data = text.encode('utf-8')
+        self._rules_hash.update(data)
+        self._emit(data)
+    
+    def writelines(self, lines):
+        """按批写入规则行，减少哈希与压缩调用次数"""
+        batch = []
+        for line in lines:
+            batch.append(line)
+            if len(batch) >= self.BATCH_LINES:
+                self.write(''.join(batch))
+                batch = []
+        if batch:
+            self.write(''.join(batch))
+    
+    def close(self) -> Dict[str, Any]:
+        """结束压缩并关闭文件，返回 manifest 条目"""
+        if self.entry is not None:
+            return self.entry
+        self._file.close()
+        compressed = {}
+        for item in self._compressed:
+            self._write_compressed(item, item['finish']())
+            item['file'].close()
+            compressed[item['format']] = {
+                'file': os.path.basename(item['path']),
+                'size': item['size'],
+                'sha256': item['hash'].hexdigest()
+            }
+        self.entry = {
+            'size': self._size,
+            'sha256': self._hash.hexdigest(),
+            'rules_sha256': self._rules_hash.hexdigest(),
+            'rules': self.rules,
+            'compressed': compressed
+        }
+        return self.entry
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+class DiffUpdateManager:
+    """差量更新：为每个输出文件生成相邻两代之间的补丁，并按保留期限维护补丁链
+    
+    采用 AdGuard / uBlock Origin 支持的差量更新格式（Diff-Path + RCS 补丁）：
+    - 每代文件头包含 "Diff-Path: patches/<名称>/<名称>-s-<生成时间戳>-<有效期秒数>.patch"，
+      指向"下一次生成时"才会写入的补丁；客户端请求该路径，不存在表示尚无更新
+    - 补丁为 `diff -n` 格式（aN M / dN M，行号基于旧文件），首行为
+      "diff checksum:<新文件SHA-1> lines:<补丁行数>"，客户端应用后可校验
+    - patches/index.json 记录每个文件的补丁链（补丁路径、前后两代SHA-256、增删行数）
+    上一代文件不含 Diff-Path（首次启用）时只开始新的补丁链。
+    """
+    
+    PATCH_DIR = "dist/patches"
+    DIFF_PATH_PATTERN = re.compile(r'^[!#]\s*Diff-Path:\s*(\S+)', re.MULTILINE)
+    PATCH_TIME_PATTERN = re.compile(r'-s-(\d+)-\d+\.patch$')
+    
+    def __init__(self):
+        self.created = int(time.time())
+        self.expiration = Config.DIFF_PATCH_EXPIRATION_HOURS * 3600
+        self.index_path = os.path.join(self.PATCH_DIR, 'index.json')
+        self._previous = {}
+    
+    def _patch_name(self, file_path: str) -> str:
+        """本代文件的 Diff-Path（相对于输出文件所在目录）"""
+        stem = Path(file_path).stem
+        return f"patches/{stem}/{stem}-s-{self.created}-{self.expiration}.patch"
+    
+    def prepare(self, file_path: str, comment: str) -> str:
+        """写入新文件前调用：读取上一代文件，返回新文件头中的 Diff-Path 行"""
+        try:
+            with open(file_path, 'rb') as f:
+                content = f.read()
+            text = content.decode('utf-8')
+            match = self.DIFF_PATH_PATTERN.search(text[:4096])
+            self._previous[file_path] = {
+                'lines': text.split('\n'),
+                'sha256': hashlib.sha256(content).hexdigest(),
+                'diff_path': match.group(1) if match else None
+            }
+        except (OSError, UnicodeDecodeError):
+            pass
+        return f"{comment} Diff-Path: {self._patch_name(file_path)}\n"
+    
+    @staticmethod
+    def rcs_diff(old: List[str], new: List[str]) -> Tuple[List[str], int, int]:
+        """生成 `diff -n` 格式补丁，返回 (补丁行, 新增行数, 删除行数)"""
+        patch = []
+        added = removed = 0
+        matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag in ('delete', 'replace'):
+                patch.append(f"d{i1 + 1} {i2 - i1}")
+                removed += i2 - i1
+            if tag in ('insert', 'replace'):
+                patch.append(f"a{i2} {j2 - j1}")
+                patch.extend(new[j1:j2])
+                added += j2 - j1
+        return patch, added, removed
+    
+    def _resolve(self, file_path: str, diff_path: str) -> Optional[str]:
+        """Diff-Path 对应的补丁文件路径（必须位于补丁目录内）"""
+        path = os.path.normpath(os.path.join(os.path.dirname(file_path), diff_path.split('#')[0]))
+        root = os.path.normpath(self.PATCH_DIR)
+        return path if path.startswith(root + os.sep) else None
+    
+    def finish(self) -> Dict[str, Any]:
+        """全部文件写完后调用：生成补丁、清理过期补丁并更新索引"""
+        index = {}
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            pass
+        
+        for file_path, previous in self._previous.items():
+            patch_path = self._resolve(file_path, previous['diff_path']) if previous['diff_path'] else None
+            if patch_path is None:
+                continue
+            with open(file_path, 'rb') as f:
+                content = f.read()
+            patch, added, removed = self.rcs_diff(previous['lines'], content.decode('utf-8').split('\n'))
+            
+            os.makedirs(os.path.dirname(patch_path), exist_ok=True)
+            with open(patch_path, 'w', encoding='utf-8', newline='\n') as f:
+                f.write(f"diff checksum:{hashlib.sha1(content).hexdigest()} lines:{len(patch)}\n")
+                f.write(''.join(f"{line}\n" for line in patch))
+            
+            index.setdefault(os.path.basename(file_path), []).append({
+                'patch': previous['diff_path'],
+                'created': datetime.fromtimestamp(self.created, timezone.utc).isoformat(),
+                'from_sha256': previous['sha256'],
+                'to_sha256': hashlib.sha256(content).hexdigest(),
+                'added': added,
+                'removed': removed,
+                'size': os.path.getsize(patch_path)
+            })
+            print(f"  🩹 差量补丁: {patch_path} (+{added:,} / -{removed:,} 行, "
+                  f"{os.path.getsize(patch_path) / 1024:.1f} KB)")
+        
+        self._previous = {}
+        self._prune(index)
+        os.makedirs(self.PATCH_DIR, exist_ok=True)
+        with open(self.index_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=2, ensure_ascii=False)
+        return index
+    
+    def _prune(self, index: Dict[str, List[Dict[str, Any]]]):
+        """删除超过保留天数的补丁文件及其索引条目"""
+        cutoff = self.created - Config.DIFF_PATCH_RETENTION_DAYS * 86400
+        for patch_file in Path(self.PATCH_DIR).glob('*/*.patch'):
+            match = self.PATCH_TIME_PATTERN.search(patch_file.name)
+            if match and int(match.group(1)) < cutoff:
+                patch_file.unlink()
+        for name, chain in index.items():
+            index[name] = [item for item in chain
+                           if os.path.exists(os.path.join("dist", item['patch'].split('#')[0]))]
+
 class RuleOutputManager:
     """规则输出管理器"""
     
+    OUTPUT_FILES = ("dist/Adblock.txt", "dist/hosts.txt", "dist/Domains.txt")
+    # 本机名称：不能改写到 HOSTS_SINK_ADDRESS
+    LOOPBACK_NAMES = frozenset({'localhost', 'localhost.localdomain', 'local', '0.0.0.0'})
+    
+    @classmethod
+    def output_size(cls) -> int:
+        """输出文件总字节数"""
+        return sum(os.path.getsize(path) for path in cls.OUTPUT_FILES if os.path.exists(path))
+    
     @staticmethod
-    def save_results(rules: List[str]) -> bool:
+    def save_results(rules: List[RuleRecord]) -> bool:
         """保存优化后的规则"""
         try:
             os.makedirs("dist", exist_ok=True)
@@ -742,24 +2468,41 @@ class RuleOutputManager:
             domain_rules = []
             
             for rule in rules:
-                if rule.startswith('||') or '##' in rule or rule.startswith('|'):
-                    adblock_rules.append(rule)
-                elif rule.startswith('0.0.0.0') or rule.startswith('127.0.0.1'):
-                    hosts_rules.append(rule)
-                elif DOMAIN_PATTERN.match(rule):
-                    domain_rules.append(rule)
+                if rule.kind == RuleRecord.ADBLOCK:
+                    adblock_rules.append(rule.text)
+                elif rule.kind == RuleRecord.HOSTS:
+                    hosts_rules.append(rule.text)
+                elif rule.kind == RuleRecord.DOMAIN:
+                    domain_rules.append(rule.text)
+            
+            formats = ArtifactWriter.available_formats()
+            artifacts = {}
+            # 差量更新：写入前读取上一代文件，全部写完后生成补丁
+            diff_updates = DiffUpdateManager() if Config.DIFF_UPDATES_ENABLED else None
             
             # 保存Adblock规则
             if adblock_rules:
-                RuleOutputManager._save_adblock_rules(adblock_rules, current_time)
+                diff_header = diff_updates.prepare("dist/Adblock.txt", '!') if diff_updates else ''
+                artifacts['Adblock.txt'] = RuleOutputManager._save_adblock_rules(
+                    adblock_rules, current_time, formats, diff_header)
             
             # 保存Hosts规则
             if hosts_rules:
-                RuleOutputManager._save_hosts_rules(hosts_rules, current_time)
+                diff_header = diff_updates.prepare("dist/hosts.txt", '#') if diff_updates else ''
+                artifacts['hosts.txt'] = RuleOutputManager._save_hosts_rules(
+                    hosts_rules, current_time, formats, diff_header)
             
             # 保存域名规则
             if domain_rules:
-                RuleOutputManager._save_domain_rules(domain_rules, current_time)
+                diff_header = diff_updates.prepare("dist/Domains.txt", '#') if diff_updates else ''
+                artifacts['Domains.txt'] = RuleOutputManager._save_domain_rules(
+                    domain_rules, current_time, formats, diff_header)
+            
+            if diff_updates:
+                diff_updates.finish()
+            
+            if Config.DIST_MANIFEST_ENABLED:
+                RuleOutputManager._save_manifest(artifacts, current_time)
             
             print(f"  💾 总计保存: {len(rules):,} 条规则")
             return True
@@ -771,17 +2514,37 @@ class RuleOutputManager:
             return False
     
     @staticmethod
-    def _save_adblock_rules(rules: List[str], current_time: str):
+    def _save_manifest(artifacts: Dict[str, Dict[str, Any]], current_time: str):
+        """写入 dist/manifest.json（本次未重写的文件保留原条目）"""
+        manifest_path = "dist/manifest.json"
+        files = {}
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                files = json.load(f).get('files', {})
+        except (OSError, ValueError):
+            pass
+        files.update(artifacts)
+        
+        manifest = {'generated_at': current_time, 'files': files}
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        print(f"  🧾 清单: {manifest_path} ({len(files)} 个文件)")
+    
+    @staticmethod
+    @traced('output')
+    def _save_adblock_rules(rules: List[str], current_time: str, formats: List[str],
+                            diff_header: str = '') -> Dict[str, Any]:
         """保存Adblock规则"""
         file_path = "dist/Adblock.txt"
         batch_size = Config.BATCH_PROCESS_SIZE
         
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(f"""! Adblock规则 - 多阶段优化版
+        with ArtifactWriter(file_path, formats) as f:
+            f.rules = len(rules)
+            f.write_header(f"""! Adblock规则 - 多阶段优化版
 ! 生成时间: {current_time}
 ! 规则数量: {len(rules):,}
 ! 项目地址: https://github.com/{Config.REPO_OWNER}/{Config.REPO_NAME}
-! 优化流程: 下载 → 解析 → 去重 → 优化 → 二次优化 → 输出
+{diff_header}! 优化流程: 下载 → 解析 → 去重 → 优化 → 二次优化 → 输出
 !
 
 """)
@@ -792,61 +2555,456 @@ class RuleOutputManager:
         
         file_size = os.path.getsize(file_path) / (1024 * 1024)
         print(f"  ✅ Adblock规则: {len(rules):,} 条 ({file_size:.2f} MB)")
+        return f.entry
     
     @staticmethod
-    def _save_hosts_rules(rules: List[str], current_time: str):
-        """保存Hosts规则"""
+    @traced('output')
+    def _save_hosts_rules(rules: List[str], current_time: str, formats: List[str],
+                          diff_header: str = '') -> Dict[str, Any]:
+        """保存Hosts规则（流式写入：0.0.0.0 规则在前，127.0.0.1 规则在后）"""
         file_path = "dist/hosts.txt"
-        batch_size = Config.BATCH_PROCESS_SIZE
+        if Config.HOSTS_COMPACT:
+            return RuleOutputManager._save_compact_hosts_rules(rules, current_time, file_path, formats, diff_header)
         
-        # 分离0.0.0.0和127.0.0.1
-        zero_rules = [r for r in rules if r.startswith('0.0.0.0')]
-        local_rules = [r for r in rules if r.startswith('127.0.0.1')]
+        zero_count = sum(1 for r in rules if r.startswith('0.0.0.0'))
+        local_count = sum(1 for r in rules if r.startswith('127.0.0.1'))
         
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(f"""# Hosts规则 - 多阶段优化版
+        with ArtifactWriter(file_path, formats) as f:
+            f.rules = len(rules)
+            f.write_header(f"""# Hosts规则 - 多阶段优化版
 # 生成时间: {current_time}
-# 规则数量: {len(rules):,} (0.0.0.0: {len(zero_rules):,}, 127.0.0.1: {len(local_rules):,})
+# 规则数量: {len(rules):,} (0.0.0.0: {zero_count:,}, 127.0.0.1: {local_count:,})
 # 项目地址: https://github.com/{Config.REPO_OWNER}/{Config.REPO_NAME}
-#
+{diff_header}#
 
 """)
             # 写入0.0.0.0规则
-            if zero_rules:
-                for i in range(0, len(zero_rules), batch_size):
-                    batch = zero_rules[i:i+batch_size]
-                    f.write('\n'.join(batch) + '\n')
+            f.writelines(f"{r}\n" for r in rules if r.startswith('0.0.0.0'))
             
             # 写入127.0.0.1规则
-            if local_rules:
+            if local_count:
                 f.write('\n')
-                for i in range(0, len(local_rules), batch_size):
-                    batch = local_rules[i:i+batch_size]
-                    f.write('\n'.join(batch) + '\n')
+                f.writelines(f"{r}\n" for r in rules if r.startswith('127.0.0.1'))
         
         file_size = os.path.getsize(file_path) / (1024 * 1024)
         print(f"  ✅ Hosts规则: {len(rules):,} 条 ({file_size:.2f} MB)")
+        return f.entry
+    
+    @staticmethod
+    def _save_compact_hosts_rules(rules: List[str], current_time: str, file_path: str,
+                                  formats: List[str], diff_header: str = '') -> Dict[str, Any]:
+        """紧凑Hosts格式：统一使用 HOSTS_SINK_ADDRESS，每行最多 HOSTS_DOMAINS_PER_LINE 个域名
+        
+        两种地址指向同一域名时只保留一次。第一遍统计去重后的域名数（用于文件头），
+        第二遍写入时从集合中移除已写入的域名，只保留一个集合，不构建中间规则列表。
+        行尾注释会被去掉，无效域名与本机名称（LOOPBACK_NAMES）不写入。
+        """
+        sink = Config.HOSTS_SINK_ADDRESS
+        per_line = max(1, Config.HOSTS_DOMAINS_PER_LINE)
+        
+        def iter_domains():
+            for rule in rules:
+                # "地址 域名 [域名...] [# 注释]"，注释之后的内容不是域名
+                for domain in rule.split('#', 1)[0].split()[1:]:
+                    if (domain.lower() not in RuleOutputManager.LOOPBACK_NAMES
+                            and SmartRuleParser.is_valid_domain(domain)):
+                        yield domain
+        
+        pending = {domain.lower() for domain in iter_domains()}
+        domain_count = len(pending)
+        
+        with ArtifactWriter(file_path, formats) as f:
+            f.rules = domain_count
+            f.write_header(f"""# Hosts规则 - 多阶段优化版
+# 生成时间: {current_time}
+# 域名数量: {domain_count:,} (紧凑格式: {sink}，每行最多 {per_line} 个域名)
+# 项目地址: https://github.com/{Config.REPO_OWNER}/{Config.REPO_NAME}
+{diff_header}#
+
+""")
+            line = []
+            for domain in iter_domains():
+                key = domain.lower()
+                if key not in pending:
+                    continue
+                pending.discard(key)
+                line.append(domain)
+                if len(line) == per_line:
+                    f.write(f"{sink} {' '.join(line)}\n")
+                    line = []
+            if line:
+                f.write(f"{sink} {' '.join(line)}\n")
+        
+        file_size = os.path.getsize(file_path) / (1024 * 1024)
+        print(f"  ✅ Hosts规则: {len(rules):,} 条 → {domain_count:,} 个域名，"
+              f"每行 {per_line} 个 ({file_size:.2f} MB)")
+        return f.entry
     
     @staticmethod
-    def _save_domain_rules(rules: List[str], current_time: str):
+    @traced('output')
+    def _save_domain_rules(rules: List[str], current_time: str, formats: List[str],
+                           diff_header: str = '') -> Dict[str, Any]:
         """保存域名规则"""
         file_path = "dist/Domains.txt"
         
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(f"""# 域名规则 - 多阶段优化版
+        with ArtifactWriter(file_path, formats) as f:
+            f.rules = len(rules)
+            f.write_header(f"""# 域名规则 - 多阶段优化版
 # 生成时间: {current_time}
 # 域名数量: {len(rules):,}
 # 项目地址: https://github.com/{Config.REPO_OWNER}/{Config.REPO_NAME}
-#
+{diff_header}#
 
 """)
             # 按字母顺序排序
-            sorted_rules = sorted(rules)
-            for rule in sorted_rules:
-                f.write(f"{rule}\n")
+            f.writelines(f"{rule}\n" for rule in sorted(rules))
         
         file_size = os.path.getsize(file_path) / (1024 * 1024)
         print(f"  ✅ 域名规则: {len(rules):,} 条 ({file_size:.2f} MB)")
+        return f.entry
+
+class RunHistory:
+    """运行历史存储：stats/history.jsonl，每次运行追加一行（含各阶段统计），取代每次运行一个JSON文件
+    
+    - 只追加写入，崩溃时最多留下一行不完整记录，读取时跳过；下次追加前先补齐换行，不影响新记录
+    - 超过保留天数或最大条数时整体重写（先写临时文件再替换）
+    - 文件不存在时自动导入旧的 processing_stats_*.json（不删除旧文件）
+    """
+    
+    FILE_NAME = 'history.jsonl'
+    LEGACY_PATTERN = 'processing_stats_*.json'
+    
+    def __init__(self, stats_dir: str = Config.STATS_DIR):
+        self.stats_dir = Path(stats_dir)
+        self.path = self.stats_dir / self.FILE_NAME
+    
+    @staticmethod
+    def _run_time(row: Dict[str, Any]) -> Optional[datetime]:
+        try:
+            return datetime.fromisoformat(row['processing_info']['timestamp'])
+        except (KeyError, TypeError, ValueError):
+            return None
+    
+    def _read_rows(self):
+        if not self.path.exists():
+            self.import_legacy()
+            if not self.path.exists():
+                return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+    
+    def append(self, run_id: str, stats: Dict[str, Any]):
+        """追加一次运行，必要时压缩"""
+        if not self.path.exists():
+            self.import_legacy()
+        self.stats_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'a+b') as f:
+            # 上次写入中断时文件不以换行结尾，先补齐，避免新记录拼接在残缺行之后
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'run_id': run_id, **stats}, ensure_ascii=False,
+                               separators=(',', ':')) + '\n')
+        self.compact()
+    
+    def compact(self, force: bool = False) -> int:
+        """移除超出保留期限/条数的记录，返回移除条数（无需移除时不重写文件）"""
+        rows = list(self._read_rows())
+        cutoff = datetime.now() - timedelta(days=Config.HISTORY_RETENTION_DAYS)
+        kept = [row for row in rows
+                if (self._run_time(row) or datetime.max) >= cutoff][-Config.HISTORY_MAX_RUNS:]
+        removed = len(rows) - len(kept)
+        if removed or force:
+            temp_path = self.path.with_suffix('.tmp')
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                for row in kept:
+                    f.write(json.dumps(row, ensure_ascii=False, separators=(',', ':')) + '\n')
+            os.replace(temp_path, self.path)
+        return removed
+    
+    def import_legacy(self) -> int:
+        """导入旧格式的每次运行JSON（按时间顺序），返回导入条数"""
+        files = sorted(self.stats_dir.glob(self.LEGACY_PATTERN))
+        if not files:
+            return 0
+        imported = 0
+        temp_path = self.path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as out:
+            for stats_file in files:
+                try:
+                    with open(stats_file, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                except:
+                    continue
+                run_id = stats_file.stem[len('processing_stats_'):]
+                out.write(json.dumps({'run_id': run_id, **data}, ensure_ascii=False,
+                                     separators=(',', ':')) + '\n')
+                imported += 1
+        os.replace(temp_path, self.path)
+        print(f"  📦 已导入 {imported} 条历史运行记录到 {self.path}")
+        return imported
+    
+    def runs(self, last: Optional[int] = None, status: Optional[str] = None,
+             days: Optional[int] = None) -> List[Dict[str, Any]]:
+        """按时间顺序返回运行记录（可按最近条数、状态、天数过滤）"""
+        cutoff = datetime.now() - timedelta(days=days) if days is not None else None
+        rows = []
+        for row in self._read_rows():
+            if status is not None and row.get('processing_info', {}).get('status') != status:
+                continue
+            if cutoff is not None and (self._run_time(row) or datetime.min) < cutoff:
+                continue
+            rows.append(row)
+        return rows[-last:] if last else rows
+    
+    def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """按运行ID（时间戳，如 20260104_034611）查找"""
+        return next((row for row in self._read_rows() if row.get('run_id') == run_id), None)
+    
+    def stage_series(self, stage: str, field: str = 'time', days: int = 90) -> List[Tuple[str, Any]]:
+        """某阶段某项统计的时间序列，如 stage_series('stage5_secondary', 'time', days=90)"""
+        series = []
+        for row in self.runs(days=days):
+            value = row.get('stage_statistics', {}).get(stage, {}).get(field)
+            if value is not None:
+                series.append((row['processing_info'].get('timestamp'), value))
+        return series
+
+class StageScheduler:
+    """时间预算调度器：按历史耗时预估各阶段成本，时间不足时缩减可选工作而非中止
+    
+    成本以"每条输入规则耗时"计，取最近若干次运行报告中的中位数乘以安全系数。
+    阶段3、4为必需阶段，超出总预算时才中止（检查点可续跑）；阶段3可跳过子域名优化；
+    阶段5可先跳过相似规则合并，再整体跳过；阶段6输出始终执行。
+    没有历史数据的成本按0估计，此时只在预算已耗尽时降级。
+    """
+    
+    # 成本键 → 从单次运行报告中提取 (耗时, 输入规则数)
+    COST_KEYS = ('stage3_dedup', 'stage3_subdomain', 'stage4_optimize',
+                 'stage5_secondary', 'stage5_merge', 'stage6_output')
+    
+    DEGRADATION_LABELS = {
+        'skip_subdomain': '跳过子域名优化',
+        'skip_merge': '跳过相似规则合并',
+        'skip': '跳过整个阶段'
+    }
+    
+    def __init__(self, start_time: float):
+        self.start_time = start_time
+        self.enabled = Config.SCHEDULER_ENABLED
+        self.budget = Config.TIMEOUT_FORCE_STOP
+        self.degradations = []
+        self.history_runs = 0
+        self.rates = self._load_history() if self.enabled else {}
+    
+    def _load_history(self) -> Dict[str, float]:
+        """读取最近的运行报告，计算各成本键的每条规则耗时（中位数）"""
+        samples = defaultdict(list)
+        
+        for data in RunHistory().runs(last=Config.SCHEDULER_HISTORY_RUNS):
+            self.history_runs += 1
+            for key, (elapsed, count) in self._extract_costs(data).items():
+                if elapsed and count:
+                    samples[key].append(elapsed / count)
+        
+        return {key: statistics.median(values) for key, values in samples.items()}
+    
+    @staticmethod
+    def _extract_costs(data: Dict[str, Any]) -> Dict[str, Tuple[float, int]]:
+        """单次运行的各项耗时；该次运行中被降级的阶段不作为样本"""
+        stages = data.get('stage_statistics', {})
+        degraded = {item.get('stage') for item in data.get('scheduler', {}).get('degradations', [])}
+        
+        costs = {}
+        for key in ('stage3_dedup', 'stage4_optimize', 'stage5_secondary'):
+            stage = stages.get(key, {})
+            if key not in degraded:
+                costs[key] = (stage.get('time'), stage.get('before'))
+        output = stages.get('stage6_output', {})
+        costs['stage6_output'] = (output.get('time'), output.get('rules'))
+        
+        subdomain = data.get('deduplication_stats', {}).get('stage3_subdomain', {})
+        costs['stage3_subdomain'] = (subdomain.get('time'), subdomain.get('before'))
+        merge_time = data.get('secondary_optimization_stats', {}).get('merge_time')
+        costs['stage5_merge'] = (merge_time, stages.get('stage5_secondary', {}).get('before'))
+        return costs
+    
+    def estimate(self, key: str, rule_count: int) -> float:
+        """预估耗时（秒），无历史数据时为0"""
+        rate = self.rates.get(key)
+        if rate is None:
+            return 0.0
+        return rate * rule_count * Config.SCHEDULER_SAFETY_FACTOR
+    
+    def remaining(self) -> float:
+        return self.budget - (time.time() - self.start_time)
+    
+    def plan(self, stage: str, rule_count: int) -> Tuple[str, Dict[str, bool]]:
+        """决定阶段的执行方式：('run', 降级参数) / ('skip', {}) / ('abort', {})"""
+        remaining = self.remaining()
+        
+        # 未启用时与原超时保护一致：预算耗尽即中止；
+        # 启用时输出始终执行（总超时留有60秒余量），阶段5改为跳过
+        mandatory = not self.enabled or stage not in ('stage5_secondary', 'stage6_output')
+        if mandatory and remaining < 0:
+            print(f"⏰ 超时保护触发：已运行 {self.budget - remaining:.0f} 秒")
+            return 'abort', {}
+        
+        if not self.enabled:
+            return 'run', {}
+        
+        estimate = self.estimate
+        output_reserve = estimate('stage6_output', rule_count)
+        
+        if stage == 'stage3_dedup' and Config.SUBDOMAIN_OPTIMIZATION:
+            # 阶段4、6必需，阶段5可整体跳过
+            needed = (estimate('stage3_dedup', rule_count) +
+                      estimate('stage4_optimize', rule_count) + output_reserve)
+            if needed > remaining:
+                self._degrade(stage, 'skip_subdomain', remaining, needed)
+                return 'run', {'skip_subdomain': True}
+        
+        elif stage == 'stage5_secondary' and Config.ENABLE_SECONDARY_OPTIMIZATION:
+            needed = estimate('stage5_secondary', rule_count) + output_reserve
+            if needed <= remaining:
+                return 'run', {}
+            
+            without_merge = needed - estimate('stage5_merge', rule_count)
+            if Config.MERGE_SIMILAR_RULES and without_merge < needed and without_merge <= remaining:
+                self._degrade(stage, 'skip_merge', remaining, needed)
+                return 'run', {'skip_merge': True}
+            
+            self._degrade(stage, 'skip', remaining, needed)
+            return 'skip', {}
+        
+        return 'run', {}
+    
+    def _degrade(self, stage: str, action: str, remaining: float, needed: float):
+        self.degradations.append({
+            'stage': stage,
+            'action': action,
+            'remaining_seconds': round(remaining, 1),
+            'estimated_seconds': round(needed, 1)
+        })
+        print(f"  ⚠️  时间预算不足（剩余 {remaining:.0f} 秒，预计需要 {needed:.0f} 秒）："
+              f"{self.DEGRADATION_LABELS[action]}")
+    
+    def report(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'budget_seconds': self.budget,
+            'history_runs': self.history_runs,
+            'rates_per_rule': {key: round(rate, 9) for key, rate in self.rates.items()},
+            'degradations': self.degradations
+        }
+
+class CheckpointManager:
+    """阶段检查点：每个阶段完成后把规则与统计写入磁盘，超时中断后可用 --resume 续跑
+    
+    检查点目录只保留最近完成的阶段。清单记录阶段名、创建时间与运行指纹
+    （规则源、全部配置项与处理脚本内容），任一变化或超过有效期即视为失效。
+    """
+    
+    VERSION = 1
+    MANIFEST = 'manifest.json'
+    
+    def __init__(self, sources: List[str]):
+        self.enabled = Config.CHECKPOINT_ENABLED
+        self.checkpoint_dir = Path(Config.CACHE_DIR) / 'checkpoints'
+        self.fingerprint = self._fingerprint(sources)
+    
+    @classmethod
+    def _fingerprint(cls, sources: List[str]) -> str:
+        settings = {key: value for key, value in vars(Config).items()
+                    if key.isupper() and isinstance(value, (str, int, float, bool, list, tuple, dict))}
+        digest = hashlib.sha1(repr((cls.VERSION, list(sources), sorted(settings.items()))).encode())
+        try:
+            with open(__file__, 'rb') as f:
+                digest.update(f.read())
+        except OSError:
+            pass
+        return digest.hexdigest()
+    
+    def _load_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(self.checkpoint_dir / self.MANIFEST, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            return manifest if isinstance(manifest, dict) else {}
+        except:
+            return {}
+    
+    @traced('checkpoint')
+    def save(self, stage: str, rules: List[RuleRecord], state: Dict[str, Any]):
+        """写入阶段检查点（先写数据再原子替换清单，中断时旧检查点仍然有效）"""
+        if not self.enabled:
+            return
+        
+        start_time = time.time()
+        try:
+            self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+            data_file = self.checkpoint_dir / f"{stage}.pickle"
+            tmp_file = data_file.with_suffix('.tmp')
+            with open(tmp_file, 'wb') as f:
+                pickle.dump({'records': pack_records(rules, with_sources=True), 'state': state},
+                            f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, data_file)
+            
+            previous = self._load_manifest().get('file')
+            manifest = {
+                'version': self.VERSION,
+                'stage': stage,
+                'file': data_file.name,
+                'rules': len(rules),
+                'fingerprint': self.fingerprint,
+                'created_at': time.time()
+            }
+            manifest_file = self.checkpoint_dir / self.MANIFEST
+            tmp_file = manifest_file.with_suffix('.tmp')
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False)
+            os.replace(tmp_file, manifest_file)
+            
+            if previous and previous != data_file.name:
+                (self.checkpoint_dir / previous).unlink(missing_ok=True)
+            
+            size_mb = data_file.stat().st_size / (1024 * 1024)
+            print(f"  💾 检查点已保存: {stage} ({len(rules):,} 条, {size_mb:.1f}MB, "
+                  f"耗时: {time.time() - start_time:.2f}s)")
+        except Exception as e:
+            print(f"  ⚠️  检查点保存失败: {e}")
+    
+    def load(self) -> Optional[Tuple[str, List[RuleRecord], Dict[str, Any]]]:
+        """读取最近完成阶段的检查点，返回 (阶段名, 规则, 统计状态)；不可用时返回None"""
+        manifest = self._load_manifest()
+        if not manifest:
+            print("  ℹ️  未找到检查点，从头开始处理")
+            return None
+        if manifest.get('fingerprint') != self.fingerprint:
+            print("  ⚠️  检查点与当前规则源/配置/脚本不一致，从头开始处理")
+            return None
+        age_hours = (time.time() - manifest.get('created_at', 0)) / 3600
+        if age_hours > Config.CHECKPOINT_MAX_AGE_HOURS:
+            print(f"  ⚠️  检查点已过期 ({age_hours:.1f} 小时前)，从头开始处理")
+            return None
+        
+        try:
+            with open(self.checkpoint_dir / manifest['file'], 'rb') as f:
+                data = pickle.load(f)
+        except Exception as e:
+            print(f"  ⚠️  检查点读取失败: {e}，从头开始处理")
+            return None
+        
+        return manifest['stage'], unpack_records(data['records']), data['state']
+    
+    def clear(self):
+        """处理成功后删除检查点"""
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
 
 class SmartRuleProcessor:
     """智能规则处理器（多阶段优化版）"""
@@ -859,6 +3017,7 @@ class SmartRuleProcessor:
         self.optimizer = AdvancedRuleOptimizer()
         self.secondary_optimizer = SecondaryOptimizer()
         self.output_manager = RuleOutputManager()
+        self.parsed_cache = ParsedRuleCache()
         
         # 加载规则源
         try:
@@ -873,76 +3032,83 @@ class SmartRuleProcessor:
             ]
         
         self.all_rules = []
+        self.raw_rule_count = 0  # 源内去重前的解析规则数
         self.final_rules = []
         
-    def process(self) -> bool:
-        """主处理流程"""
+    def process(self, resume: bool = False, profile: bool = False) -> bool:
+        """主处理流程（resume为True时从最近完成阶段的检查点继续，profile为True时按阶段剖析）"""
         print("=" * 70)
         print("🚀 广告规则自动化处理系统 - 多阶段优化版")
         print(f"📅 开始时间: {get_time_string()}")
         print(f"📊 规则源: {len(self.rule_sources)} 个")
-        print(f"⚙️  配置: 并发={Config.MAX_WORKERS}, 超时={Config.REQUEST_TIMEOUT}s")
+        print(f"⚙️  配置: 并发={Config.MAX_WORKERS}, 超时={Config.REQUEST_TIMEOUT}s, 下载引擎={Config.DOWNLOAD_ENGINE}")
         print("=" * 70)
         
         # 设置总超时
         signal.alarm(Config.TIMEOUT_FORCE_STOP + 60)
+        if Config.ENABLE_TRACING:
+            TRACER.start()
+        if profile:
+            self.multi_stage.profiler = StageProfiler()
+        self.checkpoints = CheckpointManager(self.rule_sources)
+        self.scheduler = StageScheduler(self.multi_stage.start_time)
         
         try:
-            # 阶段1：下载
-            stage_start = self.multi_stage.log_stage_start("阶段1: 下载规则源")
-            contents = self._download_sources()
-            self.multi_stage.log_stage_end('stage1_download', stage_start, rules=len(contents))
-            
-            if self._check_timeout():
-                return False
-            
-            # 阶段2：解析
-            stage_start = self.multi_stage.log_stage_start("阶段2: 解析规则")
-            self._parse_contents(contents)
-            self.multi_stage.log_stage_end('stage2_parse', stage_start, rules=len(self.all_rules))
-            
-            if self._check_timeout():
-                return False
-            
-            # 阶段3：多阶段去重
-            stage_start = self.multi_stage.log_stage_start("阶段3: 多阶段去重")
-            deduplicated_rules = self.deduplicator.deduplicate(self.all_rules)
-            self.multi_stage.log_stage_end('stage3_dedup', stage_start, 
-                                          before=len(self.all_rules), 
-                                          after=len(deduplicated_rules))
-            
-            if self._check_timeout():
-                return False
-            
-            # 阶段4：优化
-            stage_start = self.multi_stage.log_stage_start("阶段4: 规则优化")
-            optimized_rules = self.optimizer.optimize(deduplicated_rules)
-            self.multi_stage.log_stage_end('stage4_optimize', stage_start,
-                                          before=len(deduplicated_rules),
-                                          after=len(optimized_rules))
+            restored = self.checkpoints.load() if resume else None
+            if restored:
+                completed_stage, rules, state = restored
+                self._restore_state(state)
+                self.all_rules = rules
+                self.multi_stage.stats['resumed_from'] = completed_stage
+                print(f"♻️  从检查点恢复: {completed_stage} 已完成 ({len(rules):,} 条规则)")
+            else:
+                completed_stage = None
+                rules = self._collect_rules()
+                if rules is None:
+                    return False
+                self.checkpoints.save('stage2_parse', rules, self._checkpoint_state())
             
-            if self._check_timeout():
-                return False
+            # 阶段3-5：依次处理，每个阶段完成后写入检查点
+            stages = self._rule_stages()
+            stage_names = [name for name, _, _ in stages]
+            first = stage_names.index(completed_stage) + 1 if completed_stage in stage_names else 0
             
-            # 阶段5：二次优化
-            stage_start = self.multi_stage.log_stage_start("阶段5: 二次优化")
-            final_rules = self.secondary_optimizer.optimize(optimized_rules)
-            self.multi_stage.log_stage_end('stage5_secondary', stage_start,
-                                          before=len(optimized_rules),
-                                          after=len(final_rules))
+            for stage_name, title, run in stages[first:]:
+                action, options = self.scheduler.plan(stage_name, len(rules))
+                if action == 'abort':
+                    return False
+                
+                stage_start = self.multi_stage.log_stage_start(title)
+                before = len(rules)
+                bytes_in = self._text_size(rules)
+                if action == 'skip':
+                    self.multi_stage.stats[stage_name]['skipped'] = True
+                else:
+                    rules = run(rules, **options)
+                self.multi_stage.log_stage_end(stage_name, stage_start,
+                                               bytes_in=bytes_in, bytes_out=self._text_size(rules),
+                                               before=before, after=len(rules))
+                self.checkpoints.save(stage_name, rules, self._checkpoint_state())
             
+            final_rules = rules
             self.final_rules = final_rules
             
-            if self._check_timeout():
+            action, _ = self.scheduler.plan('stage6_output', len(final_rules))
+            if action == 'abort':
                 return False
             
             # 阶段6：输出
             stage_start = self.multi_stage.log_stage_start("阶段6: 保存结果")
             success = self.output_manager.save_results(final_rules)
-            self.multi_stage.log_stage_end('stage6_output', stage_start, rules=len(final_rules))
+            self.multi_stage.log_stage_end('stage6_output', stage_start,
+                                           bytes_in=self._text_size(final_rules),
+                                           bytes_out=self.output_manager.output_size(),
+                                           rules=len(final_rules))
             
             # 生成报告
             self._generate_final_report(success)
+            if success:
+                self.checkpoints.clear()
             
             signal.alarm(0)  # 取消超时
             return success
@@ -950,12 +3116,91 @@ class SmartRuleProcessor:
         except TimeoutException:
             print("\n⏰ 处理超时，保存已处理的数据...")
             self._save_partial_results()
+            if self.checkpoints.enabled:
+                print("  💾 已完成阶段的检查点已保留，可使用 --resume 继续处理")
             return False
         except Exception as e:
             print(f"\n❌ 处理异常: {e}")
             import traceback
             traceback.print_exc()
             return False
+        finally:
+            if self.multi_stage.profiler is not None:
+                self.multi_stage.profiler.write_summary()
+    
+    def _collect_rules(self) -> Optional[List[RuleRecord]]:
+        """阶段1、2：下载并解析所有规则源，超时返回None"""
+        if Config.STREAMING_PIPELINE:
+            # 阶段1+2：流式下载并解析（下载与解析重叠）
+            self._stream_sources()
+        else:
+            # 阶段1：下载
+            stage_start = self.multi_stage.log_stage_start("阶段1: 下载规则源")
+            contents = self._download_sources()
+            content_size = sum(map(len, contents.values()))
+            self.multi_stage.log_stage_end('stage1_download', stage_start,
+                                           bytes_out=content_size, rules=len(contents))
+            
+            if self._check_timeout():
+                return None
+            
+            # 阶段2：解析
+            stage_start = self.multi_stage.log_stage_start("阶段2: 解析规则")
+            self._parse_contents(contents)
+            self.multi_stage.log_stage_end('stage2_parse', stage_start,
+                                           bytes_in=content_size, bytes_out=self._text_size(self.all_rules),
+                                           rules=self.raw_rule_count)
+        
+        if self._check_timeout():
+            return None
+        return self.all_rules
+    
+    def _rule_stages(self) -> List[Tuple[str, str, Callable[[List[RuleRecord]], List[RuleRecord]]]]:
+        """阶段3-5：(统计键, 标题, 处理函数)，按顺序执行"""
+        return [
+            ('stage3_dedup', "阶段3: 多阶段去重", self._deduplicate),
+            ('stage4_optimize', "阶段4: 规则优化", self.optimizer.optimize),
+            ('stage5_secondary', "阶段5: 二次优化", self.secondary_optimizer.optimize),
+        ]
+    
+    def _profiled(self, func: Callable) -> Callable:
+        """线程池任务在 --profile 时于工作线程内剖析"""
+        profiler = self.multi_stage.profiler
+        return func if profiler is None else profiler.wrap(func)
+    
+    @staticmethod
+    def _text_size(rules: List[RuleRecord]) -> Optional[int]:
+        """阶段输入/输出的规则文本大小（仅在启用性能监控时统计）"""
+        return rules_text_size(rules) if Config.ENABLE_PERFORMANCE_MONITORING else None
+    
+    def _deduplicate(self, rules: List[RuleRecord], **options) -> List[RuleRecord]:
+        deduplicated_rules = self.deduplicator.deduplicate(rules, **options)
+        if not self.all_rules:
+            # 外存去重已清空原始规则，超时保存时改用去重结果
+            self.all_rules = deduplicated_rules
+        return deduplicated_rules
+    
+    def _checkpoint_state(self) -> Dict[str, Any]:
+        """检查点中随规则一起保存的统计信息"""
+        return {
+            'stage_statistics': self.multi_stage.stats,
+            'download_stats': self.fetcher.stats,
+            'parsed_cache_stats': self.parsed_cache.stats,
+            'deduplication_stats': self.deduplicator.stats,
+            'optimization_stats': self.optimizer.stats,
+            'secondary_optimization_stats': self.secondary_optimizer.stats,
+            'raw_rule_count': self.raw_rule_count
+        }
+    
+    def _restore_state(self, state: Dict[str, Any]):
+        """恢复检查点中的统计信息（报告中沿用已完成阶段的数据）"""
+        self.multi_stage.stats.update(state['stage_statistics'])
+        self.fetcher.stats.update(state['download_stats'])
+        self.parsed_cache.stats.update(state['parsed_cache_stats'])
+        self.deduplicator.stats.update(state['deduplication_stats'])
+        self.optimizer.stats.update(state['optimization_stats'])
+        self.secondary_optimizer.stats.update(state['secondary_optimization_stats'])
+        self.raw_rule_count = state['raw_rule_count']
     
     def _check_timeout(self):
         """检查是否超时"""
@@ -968,51 +3213,255 @@ class SmartRuleProcessor:
     def _download_sources(self) -> Dict[str, str]:
         """下载所有规则源"""
         contents = {}
-        max_workers = min(Config.MAX_WORKERS, len(self.rule_sources))
+        completed = 0
+        total = len(self.rule_sources)
         
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {executor.submit(self.fetcher.fetch_url, url): url 
-                      for url in self.rule_sources}
+        def on_done(url: str, result: Tuple[bool, Optional[str], int]):
+            nonlocal completed
+            success, content, lines = result
+            completed += 1
+            
+            if success and content:
+                contents[url] = content
+                if completed % 5 == 0:
+                    print(f"  [{completed}/{total}] {lines:6d} 行")
+            else:
+                if completed % 5 == 0:
+                    print(f"  [{completed}/{total}] 失败")
+        
+        engine = Config.DOWNLOAD_ENGINE
+        if engine == 'asyncio' and not self.fetcher.async_available():
+            print("  ⚠️  未安装aiohttp，回退到线程下载引擎")
+            engine = 'thread'
+        self.multi_stage.stats['stage1_download']['engine'] = engine
+        
+        if engine == 'asyncio':
+            self.fetcher.fetch_all_async(self.rule_sources, on_done)
+        else:
+            max_workers = min(Config.MAX_WORKERS, len(self.rule_sources))
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {executor.submit(self._profiled(self.fetcher.fetch_url), url): url 
+                          for url in self.rule_sources}
+                
+                for future in as_completed(futures):
+                    on_done(futures[future], future.result())
+        
+        # 按规则源顺序排列（而非下载完成顺序），保证结果稳定
+        contents = {url: contents[url] for url in self.rule_sources if url in contents}
+        
+        print(f"✅ 下载统计: {len(contents)}成功, {self.fetcher.stats['failed']}失败, "
+              f"{self.fetcher.stats['cached']}缓存 (命中{self.fetcher.stats['cache_hit']}, "
+              f"304未修改{self.fetcher.stats['not_modified']}, 未命中{self.fetcher.stats['cache_miss']})")
+        return contents
+    
+    def _stream_sources(self):
+        """流式下载并解析所有规则源
+        
+        每个源按块读取并逐行解析，解析与其他源的下载并行进行，
+        不保留完整正文。阶段1记录整个流水线的墙钟时间，阶段2记录
+        各源累计的解析耗时（与阶段1重叠）。
+        """
+        stage_start = self.multi_stage.log_stage_start("阶段1+2: 流式下载并解析")
+        self.multi_stage.stats['stage1_download']['engine'] = 'thread-streaming'
+        
+        total = len(self.rule_sources)
+        parse_time = 0.0
+        stream_size = 0
+        completed = 0
+        results = {}
+        
+        def fetch_and_parse(source: int, url: str):
+            rules = []
+            elapsed = 0.0
+            text_size = 0
+            cached = None
+            
+            def reuse(content_hash: str) -> Optional[int]:
+                nonlocal cached
+                cached = self.parsed_cache.lookup(url, content_hash, source)
+                return cached[2] if cached else None
+            
+            def on_lines(lines: List[str]):
+                nonlocal elapsed, text_size
+                start = time.perf_counter()
+                text_size += sum(map(len, lines)) + len(lines)
+                for line in lines:
+                    parsed = self.parser.parse_line(line)
+                    if parsed:
+                        rules.append(RuleRecord.from_text(parsed, source))
+                elapsed += time.perf_counter() - start
             
-            completed = 0
-            total = len(self.rule_sources)
+            success, lines = self.fetcher.fetch_url_lines(
+                url, on_lines, reuse if self.parsed_cache.enabled else None)
+            if cached:
+                rules, raw_count, _ = cached
+            elif success:
+                content_hash = self.fetcher.cached_content_hash(url) if self.parsed_cache.enabled else None
+                rules, raw_count = self.parsed_cache.store(url, content_hash, rules, lines)
+            else:
+                raw_count = len(rules)
+            return success, lines, rules, raw_count, elapsed, text_size
+        
+        max_workers = min(Config.MAX_WORKERS, len(self.rule_sources))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self._profiled(fetch_and_parse), source, url): url
+                      for source, url in enumerate(self.rule_sources)}
             
             for future in as_completed(futures):
                 url = futures[future]
-                success, content, lines = future.result()
+                success, lines, rules, raw_count, elapsed, text_size = future.result()
                 completed += 1
+                parse_time += elapsed
+                stream_size += text_size
                 
-                if success and content:
-                    contents[url] = content
+                if success:
+                    results[url] = (rules, raw_count)
                     if completed % 5 == 0:
                         print(f"  [{completed}/{total}] {lines:6d} 行")
                 else:
                     if completed % 5 == 0:
                         print(f"  [{completed}/{total}] 失败")
         
-        print(f"✅ 下载统计: {len(contents)}成功, {self.fetcher.stats['failed']}失败, "
-              f"{self.fetcher.stats['cached']}缓存")
-        return contents
+        # 按规则源顺序合并，保证结果稳定
+        for url in self.rule_sources:
+            if url in results:
+                self._collect_parsed(*results.pop(url))
+        
+        print(f"✅ 下载统计: {self.fetcher.stats['success']}成功, {self.fetcher.stats['failed']}失败, "
+              f"{self.fetcher.stats['cached']}缓存 (命中{self.fetcher.stats['cache_hit']}, "
+              f"304未修改{self.fetcher.stats['not_modified']}, 未命中{self.fetcher.stats['cache_miss']})")
+        if self.fetcher.stats['partial']:
+            print(f"  ⚠️  {self.fetcher.stats['partial']} 个规则源下载中断，已解析的部分规则已丢弃: "
+                  f"{', '.join(self.fetcher.stats['partial_sources'])}")
+        self._log_parse_summary()
+        
+        self.multi_stage.log_stage_end('stage1_download', stage_start,
+                                       bytes_in=stream_size, bytes_out=self._text_size(self.all_rules),
+                                       rules=self.fetcher.stats['success'])
+        print("   阶段2解析耗时（与下载重叠）:")
+        self.multi_stage.stats['stage2_parse']['overlapped'] = True
+        self.multi_stage.record_stage('stage2_parse', parse_time, rules=self.raw_rule_count)
     
+    @traced('parse')
     def _parse_contents(self, contents: Dict[str, str]):
         """解析所有内容"""
+        workers = _parse_workers()
+        if workers > 1 and contents:
+            self._parse_contents_parallel(contents, workers)
+            return
+        
         rule_count = 0
+        source_ids = self._source_ids()
         
         for url, content in contents.items():
+            source = source_ids.get(url, -1)
+            content_hash = content_sha256(content) if self.parsed_cache.enabled else None
+            cached = self.parsed_cache.lookup(url, content_hash, source)
+            if cached:
+                self._collect_parsed(*cached[:2])
+                continue
+            
+            rules = []
             lines = content.split('\n')
             for line in lines:
                 parsed = self.parser.parse_line(line)
                 if parsed:
-                    self.all_rules.append(parsed)
+                    rules.append(RuleRecord.from_text(parsed, source))
                     rule_count += 1
-                
-                # 定期检查超时
-                if rule_count % 500000 == 0:
-                    print(f"  已解析 {rule_count:,} 条规则")
-                    if self._check_timeout():
-                        return
+                    
+                    # 定期检查超时
+                    if rule_count % 500000 == 0:
+                        print(f"  已解析 {rule_count:,} 条规则")
+                        if self._check_timeout():
+                            self._collect_parsed(rules, len(rules))
+                            return
+            
+            self._collect_parsed(*self.parsed_cache.store(url, content_hash, rules, len(lines)))
+        
+        self._log_parse_summary()
+    
+    @traced('parse')
+    def _parse_contents_parallel(self, contents: Dict[str, str], workers: int):
+        """多进程解析：按源分片，超大源再按块切分，结果按原顺序合并"""
+        settings = {key: getattr(Config, key) for key in PARSE_CONFIG_KEYS}
+        source_ids = self._source_ids()
+        
+        # 解析缓存命中的源不再提交给子进程
+        cached_sources = {}
+        pending = {}
+        tasks = []
+        task_urls = []
+        for url, content in contents.items():
+            source = source_ids.get(url, -1)
+            content_hash = content_sha256(content) if self.parsed_cache.enabled else None
+            cached = self.parsed_cache.lookup(url, content_hash, source)
+            if cached:
+                cached_sources[url] = cached[:2]
+                continue
+            
+            pending[url] = (content_hash, content.count('\n') + 1, [])
+            for chunk in _split_text_chunks(content, Config.PARSE_CHUNK_CHARS):
+                tasks.append((source, chunk))
+                task_urls.append(url)
         
-        print(f"✅ 解析完成: {rule_count:,} 条原始规则")
+        rule_count = 0
+        next_report = 500000
+        
+        if tasks:
+            print(f"  多进程解析: {workers} 个进程, {len(pending)} 个源")
+            with ProcessPoolExecutor(max_workers=workers,
+                                     initializer=_init_parse_worker,
+                                     initargs=(settings,)) as executor:
+                # map 按提交顺序返回结果，合并顺序与串行解析完全一致
+                for url, (source, _), packed in zip(task_urls, tasks,
+                                                    executor.map(_parse_text_chunk, *zip(*tasks))):
+                    rules = unpack_records(packed, source)
+                    pending[url][2].extend(rules)
+                    rule_count += len(rules)
+                    
+                    # 定期检查超时（未解析完的源不写入解析缓存）
+                    if rule_count >= next_report:
+                        next_report += 500000
+                        print(f"  已解析 {rule_count:,} 条规则")
+                        if self._check_timeout():
+                            executor.shutdown(wait=False, cancel_futures=True)
+                            for url in contents:
+                                if url in cached_sources:
+                                    self._collect_parsed(*cached_sources[url])
+                                elif url in pending:
+                                    rules = pending[url][2]
+                                    self._collect_parsed(rules, len(rules))
+                            return
+        
+        for url in contents:
+            if url in cached_sources:
+                self._collect_parsed(*cached_sources[url])
+            else:
+                content_hash, lines, rules = pending.pop(url)
+                self._collect_parsed(*self.parsed_cache.store(url, content_hash, rules, lines))
+        
+        self._log_parse_summary()
+    
+    def _collect_parsed(self, rules: List[RuleRecord], raw_count: int):
+        """追加单个源的解析结果"""
+        self.all_rules.extend(rules)
+        self.raw_rule_count += raw_count
+    
+    def _log_parse_summary(self):
+        """输出解析统计（含解析缓存命中情况）"""
+        print(f"✅ 解析完成: {self.raw_rule_count:,} 条原始规则")
+        if self.parsed_cache.enabled:
+            cache_stats = self.parsed_cache.stats
+            print(f"   解析缓存: 命中 {cache_stats['hit']} 个源, 重新解析 {cache_stats['miss']} 个源, "
+                  f"源内去重后 {len(self.all_rules):,} 条")
+            self.multi_stage.stats['stage2_parse'].update({
+                'cached_sources': cache_stats['hit'],
+                'unique_rules': len(self.all_rules)
+            })
+    
+    def _source_ids(self) -> Dict[str, int]:
+        """规则源URL → 序号"""
+        return {url: source for source, url in enumerate(self.rule_sources)}
     
     def _save_partial_results(self):
         """保存部分结果（超时情况下）"""
@@ -1027,9 +3476,16 @@ class SmartRuleProcessor:
                     f.write(f"! 部分规则 (超时保护)\n")
                     f.write(f"! 生成时间: {get_time_string()}\n")
                     f.write(f"! 规则数量: {len(self.all_rules):,}\n!\n\n")
-                    f.write('\n'.join(self.all_rules[:100000]))
+                    f.write('\n'.join(rule_texts(self.all_rules[:100000])))
                 
                 print(f"  ⚠️  已保存部分规则 ({len(self.all_rules):,} 条)")
+            
+            # 超时前的追踪可用于定位拖慢运行的阶段或规则源
+            if TRACER.enabled:
+                os.makedirs("stats", exist_ok=True)
+                trace_file = f"stats/trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}_partial.json"
+                TRACER.save(trace_file)
+                print(f"  🧭 追踪文件: {trace_file}")
         except:
             pass
     
@@ -1040,6 +3496,10 @@ class SmartRuleProcessor:
             self.multi_stage.stats['total_time'] = elapsed
             self.multi_stage.stats['final_rules'] = len(self.final_rules)
             
+            final_kinds = defaultdict(int)
+            for rule in self.final_rules:
+                final_kinds[rule.kind] += 1
+            
             # 合并所有统计
             full_stats = {
                 'processing_info': {
@@ -1053,14 +3513,16 @@ class SmartRuleProcessor:
                 'optimization_stats': self.optimizer.stats,
                 'secondary_optimization_stats': self.secondary_optimizer.stats,
                 'download_stats': self.fetcher.stats,
+                'scheduler': self.scheduler.report(),
                 'final_counts': {
-                    'adblock_rules': len([r for r in self.final_rules if r.startswith('||') or '##' in r or r.startswith('|')]),
-                    'hosts_rules': len([r for r in self.final_rules if r.startswith('0.0.0.0') or r.startswith('127.0.0.1')]),
-                    'domain_rules': len([r for r in self.final_rules if DOMAIN_PATTERN.match(r)]),
+                    'adblock_rules': final_kinds[RuleRecord.ADBLOCK],
+                    'hosts_rules': final_kinds[RuleRecord.HOSTS],
+                    'domain_rules': final_kinds[RuleRecord.DOMAIN],
                     'total_rules': len(self.final_rules)
                 },
                 'configuration': {
                     'max_workers': Config.MAX_WORKERS,
+                    'download_engine': self.multi_stage.stats['stage1_download']['engine'],
                     'request_timeout': Config.REQUEST_TIMEOUT,
                     'cache_enabled': Config.CACHE_ENABLED,
                     'max_adblock_rules': Config.MAX_ADBLOCK_RULES,
@@ -1069,15 +3531,29 @@ class SmartRuleProcessor:
                     'max_total_rules': Config.MAX_TOTAL_RULES
                 }
             }
+            if self.multi_stage.profiler is not None:
+                full_stats['profile_files'] = {stage: result['file']
+                                               for stage, result in self.multi_stage.profiler.results.items()}
             
-            # 保存JSON报告
+            # 追加到运行历史（可选同时保存单次运行JSON）
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            stats_file = f"stats/processing_stats_{timestamp}.json"
-            with open(stats_file, 'w', encoding='utf-8') as f:
-                json.dump(full_stats, f, indent=2, ensure_ascii=False)
+            history = RunHistory()
+            history.append(timestamp, full_stats)
+            stats_file = str(history.path)
+            if Config.STATS_WRITE_RUN_JSON:
+                stats_file = f"stats/processing_stats_{timestamp}.json"
+                with open(stats_file, 'w', encoding='utf-8') as f:
+                    json.dump(full_stats, f, indent=2, ensure_ascii=False)
             
-            # 生成Markdown报告
-            self._generate_markdown_report(full_stats, timestamp)
+            # 保存追踪文件（可在 chrome://tracing 或 ui.perfetto.dev 中打开）
+            if TRACER.enabled:
+                trace_file = f"stats/trace_{timestamp}.json"
+                events = TRACER.save(trace_file)
+                print(f"  🧭 追踪文件: {trace_file} ({events:,} 个事件)")
+            
+            # 由运行历史中的记录生成Markdown报告
+            self._generate_markdown_report(history.get(timestamp) or full_stats,
+                                           os.path.join(Config.STATS_DIR, Config.STATS_REPORT_FILE))
             
             # 打印最终总结
             print(f"\n{'='*70}")
@@ -1094,10 +3570,10 @@ class SmartRuleProcessor:
         except Exception as e:
             print(f"  ⚠️  报告生成失败: {e}")
     
-    def _generate_markdown_report(self, stats_data, timestamp):
+    @staticmethod
+    def _generate_markdown_report(stats_data, md_file):
         """生成Markdown报告"""
         try:
-            md_file = f"stats/report_{timestamp}.md"
             with open(md_file, 'w', encoding='utf-8') as f:
                 f.write(f"# 广告规则处理报告 - 多阶段优化版\n\n")
                 f.write(f"**生成时间**: {stats_data['processing_info']['start_time']}\n")
@@ -1110,15 +3586,70 @@ class SmartRuleProcessor:
                 f.write(f"- **Hosts规则**: {stats_data['final_counts']['hosts_rules']:,} 条\n")
                 f.write(f"- **域名规则**: {stats_data['final_counts']['domain_rules']:,} 条\n\n")
                 
+                partial_sources = stats_data.get('download_stats', {}).get('partial_sources', [])
+                if partial_sources:
+                    f.write(f"## ⚠️ 部分下载的规则源\n\n")
+                    f.write(f"以下规则源下载中途断开（计入失败），已解析的部分规则已丢弃，未参与本次输出：\n\n")
+                    for url in partial_sources:
+                        f.write(f"- {url}\n")
+                    f.write(f"\n")
+                
                 f.write(f"## 📈 处理效果\n\n")
                 f.write(f"- **去重移除**: {stats_data['deduplication_stats']['total_removed']:,} 条\n")
                 f.write(f"- **优化移除**: {stats_data['optimization_stats']['total_removed']:,} 条\n")
                 f.write(f"- **二次优化移除**: {stats_data['secondary_optimization_stats']['total_removed']:,} 条\n\n")
                 
+                expired_by_pattern = stats_data['secondary_optimization_stats'].get('expired_by_pattern')
+                if expired_by_pattern:
+                    f.write(f"### 过期规则命中模式\n\n")
+                    for pattern, count in sorted(expired_by_pattern.items(), key=lambda x: -x[1]):
+                        f.write(f"- `{pattern}`: {count:,} 条\n")
+                    f.write(f"\n")
+                
+                degradations = stats_data.get('scheduler', {}).get('degradations')
+                if degradations:
+                    f.write(f"## ⏱️ 时间预算降级\n\n")
+                    for item in degradations:
+                        label = StageScheduler.DEGRADATION_LABELS.get(item['action'], item['action'])
+                        f.write(f"- **{item['stage']}**: {label} "
+                                f"(剩余 {item['remaining_seconds']}秒, 预计需要 {item['estimated_seconds']}秒)\n")
+                    f.write(f"\n")
+
+                stage_metrics = [(name, stage['metrics'])
+                                 for name, stage in stats_data['stage_statistics'].items()
+                                 if isinstance(stage, dict) and stage.get('metrics')]
+                if stage_metrics:
+                    f.write(f"## 🔬 阶段性能\n\n")
+                    f.write(f"| 阶段 | 耗时 | CPU | 峰值RSS | 规则/秒 | 输入 | 输出 |\n")
+                    f.write(f"|------|------|-----|---------|---------|------|------|\n")
+                    for name, metrics in stage_metrics:
+                        peak = metrics.get('peak_rss_mb')
+                        peak = '-' if peak is None else f"{peak:.1f}MB" + ('' if metrics['peak_rss_scope'] == 'stage' else '*')
+                        rate = metrics.get('rules_per_second')
+                        f.write(f"| {name} | {metrics['wall_seconds']:.2f}秒 | {metrics['cpu_seconds']:.2f}秒 "
+                                f"| {peak} | {'-' if rate is None else f'{rate:,}'} "
+                                f"| {format_size(metrics.get('bytes_in'))} | {format_size(metrics.get('bytes_out'))} |\n")
+                    f.write(f"\n")
+                    if any(metrics['peak_rss_scope'] == 'process' for _, metrics in stage_metrics
+                           if metrics.get('peak_rss_mb') is not None):
+                        f.write(f"\\* 无法按阶段重置峰值时为进程累计峰值\n\n")
+                    for name, metrics in stage_metrics:
+                        if metrics.get('top_allocations'):
+                            f.write(f"### {name} 内存分配热点\n\n")
+                            for item in metrics['top_allocations']:
+                                f.write(f"- `{item['location']}`: {item['size_mb']}MB ({item['count']:,} 次)\n")
+                            f.write(f"\n")
+
                 f.write(f"## ⚙️ 处理配置\n\n")
                 f.write(f"- **最大并发数**: {stats_data['configuration']['max_workers']}\n")
+                f.write(f"- **下载引擎**: {stats_data['configuration'].get('download_engine', 'thread')} "
+                        f"(阶段1耗时 {stats_data['stage_statistics']['stage1_download']['time']:.2f}秒)\n")
                 f.write(f"- **请求超时**: {stats_data['configuration']['request_timeout']}秒\n")
                 f.write(f"- **缓存启用**: {stats_data['configuration']['cache_enabled']}\n")
+                parse_stats = stats_data['stage_statistics']['stage2_parse']
+                if 'cached_sources' in parse_stats:
+                    f.write(f"- **解析缓存**: 命中 {parse_stats['cached_sources']} 个源 "
+                            f"(阶段2耗时 {parse_stats['time']:.2f}秒)\n")
                 f.write(f"- **Adblock上限**: {stats_data['configuration']['max_adblock_rules']:,} 条\n")
                 f.write(f"- **Hosts上限**: {stats_data['configuration']['max_hosts_rules']:,} 条\n")
                 f.write(f"- **域名上限**: {stats_data['configuration']['max_domain_rules']:,} 条\n")
@@ -1128,7 +3659,7 @@ class SmartRuleProcessor:
                 f.write(f"- [Adblock.txt](dist/Adblock.txt)\n")
                 f.write(f"- [hosts.txt](dist/hosts.txt)\n")
                 f.write(f"- [Domains.txt](dist/Domains.txt)\n")
-                f.write(f"- [完整统计报告]({md_file})\n\n")
+                f.write(f"- [运行历史](stats/{RunHistory.FILE_NAME})\n\n")
                 
                 f.write(f"---\n")
                 f.write(f"*报告由智能广告规则自动化系统生成*\n")
@@ -1147,9 +3678,27 @@ def main():
     
     signal.signal(signal.SIGINT, interrupt_handler)
     
+    parser = argparse.ArgumentParser(description="广告规则自动化处理系统")
+    parser.add_argument('--resume', action='store_true',
+                        help='从上次中断时最近完成的阶段检查点继续处理')
+    parser.add_argument('--profile', action='store_true',
+                        help='按阶段运行cProfile，在stats目录保存 .pstats 文件与热点函数汇总')
+    parser.add_argument('--report', metavar='RUN_ID',
+                        help='从运行历史重新生成指定运行（如 20260104_034611）的Markdown报告后退出')
+    args = parser.parse_args()
+    
+    if args.report:
+        stats_data = RunHistory().get(args.report)
+        if stats_data is None:
+            print(f"❌ 运行历史中没有 {args.report}")
+            return 1
+        SmartRuleProcessor._generate_markdown_report(stats_data,
+                                                     os.path.join(Config.STATS_DIR, f"report_{args.report}.md"))
+        return 0
+    
     try:
         processor = SmartRuleProcessor()
-        success = processor.process()
+        success = processor.process(resume=args.resume, profile=args.profile)
         
         return 0 if success else 1
         
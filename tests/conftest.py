@@ -0,0 +1,100 @@
+"""
+测试公共夹具：本地规则源HTTP服务器与在临时目录中运行完整流水线
+"""
+
+import os
+import sys
+import time
+import threading
+import http.server
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录与脚本目录到Python路径
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "scripts"))
+
+from config.settings import Config
+from benchmark import SyntheticCorpus
+import smart_rule_processor
+
+
+class RuleServer:
+    """本地规则源服务器
+
+    - lists: 名称 → 正文（bytes）
+    - delays: 名称 → 响应前等待秒数，用于控制下载完成顺序
+    - truncate: 只发送一半正文后断开连接的名称集合（Content-Length 仍为完整长度）
+    """
+
+    def __init__(self):
+        self.lists = {}
+        self.delays = {}
+        self.truncate = set()
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                name = self.path.lstrip('/')
+                body = server.lists.get(name)
+                if body is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                time.sleep(server.delays.get(name, 0))
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if name in server.truncate:
+                    self.wfile.write(body[:len(body) // 2])
+                    self.wfile.flush()
+                    self.close_connection = True
+                    return
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self, name: str) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/{name}"
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def rule_server():
+    """提供4个有重叠规则的合成规则源（list0..list3）"""
+    server = RuleServer()
+    shared = SyntheticCorpus(seed=7).generate(5000)
+    for i in range(4):
+        lines = SyntheticCorpus(seed=100 + i).generate(15000) + shared
+        server.lists[f"list{i}.txt"] = ('\n'.join(lines) + '\n').encode('utf-8')
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def run_pipeline(rule_server, tmp_path, monkeypatch):
+    """在临时目录中运行完整流水线，返回处理器实例（可多次调用，共享 dist/ 与 .cache/）"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Config, 'CACHE_DIR', str(tmp_path / '.cache'))
+    monkeypatch.setattr(Config, 'TIMEOUT_FORCE_STOP', 600)
+
+    def run(names=None, **overrides):
+        for key, value in overrides.items():
+            monkeypatch.setattr(Config, key, value)
+        processor = smart_rule_processor.SmartRuleProcessor()
+        processor.rule_sources = [rule_server.url(name) for name in (names or sorted(rule_server.lists))]
+        assert processor.process()
+        return processor
+
+    return run
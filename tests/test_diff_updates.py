@@ -0,0 +1,97 @@
+"""
+差量更新：输入不变时输出逐字节一致，补丁只包含文件头变化；输入变化时补丁可还原新文件
+"""
+
+import json
+import hashlib
+from pathlib import Path
+
+from config.settings import Config
+
+OUTPUT_FILES = ('Adblock.txt', 'hosts.txt', 'Domains.txt')
+
+
+def read_body(name: str) -> bytes:
+    """输出文件去掉文件头（首个空行之前）后的正文"""
+    content = Path('dist', name).read_bytes()
+    return content.split(b'\n\n', 1)[1]
+
+
+def latest_patch(name: str) -> Path:
+    index = json.loads(Path('dist/patches/index.json').read_text(encoding='utf-8'))
+    return Path('dist', index[name][-1]['patch'])
+
+
+def patch_additions(patch: str) -> list:
+    """补丁中新增的行"""
+    commands = patch.split('\n')[1:-1]
+    added, i = [], 0
+    while i < len(commands):
+        op, count = commands[i][0], int(commands[i].split()[1])
+        i += 1
+        if op == 'a':
+            added += commands[i:i + count]
+            i += count
+    return added
+
+
+def apply_patch(old: str, patch: str) -> str:
+    """应用 `diff -n` 格式补丁（与 AdGuard/uBO 客户端的处理方式相同）"""
+    lines = old.split('\n')
+    commands = patch.split('\n')[1:-1]
+    result, pos, i = [], 0, 0
+    while i < len(commands):
+        op, start, count = commands[i][0], *map(int, commands[i][1:].split())
+        i += 1
+        if op == 'd':
+            result += lines[pos:start - 1]
+            pos = start - 1 + count
+        else:
+            result += lines[pos:start] + commands[i:i + count]
+            pos = start
+            i += count
+    return '\n'.join(result + lines[pos:])
+
+
+def test_identical_input_produces_identical_output(rule_server, run_pipeline):
+    """两次运行下载完成顺序相反，输出正文与清单中的规则哈希一致，补丁只改文件头"""
+    uncached = dict(CACHE_ENABLED=False, PARSED_CACHE_ENABLED=False, MAX_WORKERS=4)
+    names = sorted(rule_server.lists)
+
+    rule_server.delays = {name: 0.05 * (len(names) - i) for i, name in enumerate(names)}
+    run_pipeline(**uncached)
+    first = {name: read_body(name) for name in OUTPUT_FILES}
+    first_manifest = json.loads(Path('dist/manifest.json').read_text(encoding='utf-8'))
+
+    rule_server.delays = {name: 0.05 * i for i, name in enumerate(names)}
+    run_pipeline(**uncached)
+    manifest = json.loads(Path('dist/manifest.json').read_text(encoding='utf-8'))
+
+    for name in OUTPUT_FILES:
+        assert read_body(name) == first[name]
+        assert manifest['files'][name]['rules_sha256'] == first_manifest['files'][name]['rules_sha256']
+
+        added = patch_additions(latest_patch(name).read_text(encoding='utf-8'))
+        assert added and all(line.startswith(('!', '#')) for line in added), added
+
+
+def test_patch_restores_new_generation(rule_server, run_pipeline):
+    """规则源变化后，对上一代文件应用补丁得到新文件，校验和与补丁头一致"""
+    run_pipeline(CACHE_ENABLED=False, PARSED_CACHE_ENABLED=False)
+    previous = {name: Path('dist', name).read_text(encoding='utf-8') for name in OUTPUT_FILES}
+
+    lines = rule_server.lists['list0.txt'].decode('utf-8').split('\n')
+    lines = [line for i, line in enumerate(lines) if i % 40 != 3]
+    lines += [f"||added{i}.diff-test.com^" for i in range(200)]
+    lines += [f"0.0.0.0 host{i}.diff-test.net" for i in range(50)]
+    rule_server.lists['list0.txt'] = '\n'.join(lines).encode('utf-8')
+    run_pipeline(CACHE_ENABLED=False, PARSED_CACHE_ENABLED=False)
+
+    for name in OUTPUT_FILES:
+        current = Path('dist', name).read_text(encoding='utf-8')
+        patch = latest_patch(name).read_text(encoding='utf-8')
+        assert apply_patch(previous[name], patch) == current
+
+        header = patch.split('\n', 1)[0]
+        assert header.startswith(f"diff checksum:{hashlib.sha1(current.encode('utf-8')).hexdigest()} ")
+        assert len(patch.encode('utf-8')) < len(current.encode('utf-8')) // 10
@@ -0,0 +1,26 @@
+"""
+下载：流式下载中途断开时丢弃该源已解析的规则、清理临时缓存并记录为部分下载
+"""
+
+from pathlib import Path
+
+from config.settings import Config
+
+
+def test_dropped_stream_is_discarded_and_reported(rule_server, run_pipeline):
+    """断开的规则源计入 partial，其规则不参与输出，缓存目录不留 .tmp 文件"""
+    streaming = dict(STREAMING_PIPELINE=True, PARSED_CACHE_ENABLED=False)
+    complete = ['list0.txt', 'list2.txt', 'list3.txt']
+    expected = run_pipeline(complete, **streaming).raw_rule_count
+
+    rule_server.truncate = {'list1.txt'}
+    processor = run_pipeline(**dict(streaming, CACHE_ENABLED=True, CACHE_EXPIRE_HOURS=0))
+    dropped = rule_server.url('list1.txt')
+
+    assert processor.fetcher.stats['partial'] == 1
+    assert processor.fetcher.stats['partial_sources'] == [dropped]
+    assert processor.raw_rule_count == expected
+    assert not list(Path(Config.CACHE_DIR).glob('*.tmp'))
+
+    report = Path(Config.STATS_DIR, Config.STATS_REPORT_FILE).read_text(encoding='utf-8')
+    assert dropped in report
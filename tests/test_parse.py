@@ -0,0 +1,49 @@
+"""
+解析：多进程解析与串行解析结果一致，解析进程数不超过CPU核数
+"""
+
+import pytest
+
+from config.settings import Config
+import smart_rule_processor
+
+
+@pytest.fixture
+def contents(rule_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Config, 'CACHE_DIR', str(tmp_path / '.cache'))
+    monkeypatch.setattr(Config, 'PARSED_CACHE_ENABLED', False)
+    monkeypatch.setattr(Config, 'PARSE_CHUNK_CHARS', 200000)
+    return {rule_server.url(name): body.decode('utf-8') for name, body in sorted(rule_server.lists.items())}
+
+
+def parse(contents):
+    processor = smart_rule_processor.SmartRuleProcessor()
+    processor.rule_sources = list(contents)
+    processor._parse_contents(contents)
+    return processor
+
+
+def test_parallel_parse_matches_serial(contents, monkeypatch):
+    monkeypatch.setattr(Config, 'PARSE_WORKERS', 0)
+    serial = parse(contents)
+
+    monkeypatch.setattr(Config, 'PARSE_WORKERS', 2)
+    monkeypatch.setattr(smart_rule_processor.os, 'cpu_count', lambda: 4)
+    parallel = parse(contents)
+
+    assert parallel.raw_rule_count == serial.raw_rule_count
+    assert [(r.text, r.kind, r.domain, r.source) for r in parallel.all_rules] == \
+           [(r.text, r.kind, r.domain, r.source) for r in serial.all_rules]
+
+
+def test_parse_workers_clamped_to_cpu_count(contents, monkeypatch):
+    monkeypatch.setattr(Config, 'PARSE_WORKERS', 4)
+    monkeypatch.setattr(smart_rule_processor.os, 'cpu_count', lambda: 1)
+    assert smart_rule_processor._parse_workers() == 1
+
+    def fail(*args, **kwargs):
+        raise AssertionError("单核时不应启动多进程解析")
+
+    monkeypatch.setattr(smart_rule_processor.SmartRuleProcessor, '_parse_contents_parallel', fail)
+    assert parse(contents).raw_rule_count > 0
@@ -0,0 +1,52 @@
+"""
+性能回归检测：阶段1（网络）波动不影响检测，--profile 运行不参与基线与检测
+"""
+
+from datetime import datetime, timedelta
+
+from perf_gate import PerfGate, extract_metrics
+from smart_rule_processor import RunHistory
+
+
+def make_run(index: int, download: float = 30.0, dedup: float = 10.0, profiled: bool = False):
+    stats = {
+        'processing_info': {
+            'status': 'success',
+            'timestamp': (datetime.now() - timedelta(hours=10 - index)).isoformat(),
+            'total_duration_seconds': download + dedup + 5.0
+        },
+        'stage_statistics': {
+            'stage1_download': {'time': download, 'rules': 8},
+            'stage2_parse': {'time': 5.0, 'rules': 400000},
+            'stage3_dedup': {'time': dedup, 'before': 400000, 'after': 300000}
+        }
+    }
+    if profiled:
+        stats['profile_files'] = {'stage3_dedup': 'stats/profile_x_stage3_dedup.pstats'}
+    return f"run{index}", stats
+
+
+def gate(tmp_path, runs):
+    history = RunHistory(str(tmp_path))
+    for run_id, stats in runs:
+        history.append(run_id, stats)
+    return PerfGate(stats_dir=str(tmp_path), history_runs=10, min_runs=3)
+
+
+def test_download_jitter_does_not_fail_gate(tmp_path):
+    runs = [make_run(i) for i in range(5)] + [make_run(5, download=300.0)]
+    report = gate(tmp_path, runs).check()
+
+    assert report['status'] == 'ok'
+    assert 'total_time' not in extract_metrics(runs[-1][1])
+    assert extract_metrics(runs[-1][1])['gated_time'] == 15.0
+
+
+def test_profiled_runs_are_excluded(tmp_path):
+    # 基线中的剖析运行耗时被放大，不应掩盖本次的回归
+    runs = [make_run(i) for i in range(3)] + [make_run(i, dedup=40.0, profiled=True) for i in range(3, 8)]
+    checker = gate(tmp_path, runs + [make_run(8, dedup=30.0)])
+    assert checker.check()['status'] == 'regression'
+
+    checker = gate(tmp_path / 'profiled', runs[:3] + [make_run(3, dedup=40.0, profiled=True)])
+    assert checker.check()['status'] == 'profiled'